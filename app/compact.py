@@ -0,0 +1,39 @@
+"""Rewrite stored analyses into the compact format: python -m app.compact [--batch-size N] [--vacuum]"""
+from __future__ import annotations
+import argparse
+import os
+
+from sqlalchemy import text
+
+from .db import SessionLocal, engine, init_db
+from .services.analysis_store import compact_analyses
+
+
+def _file_size() -> int | None:
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or not database or database == ":memory:":
+        return None
+    return os.path.getsize(database)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deduplicate prompts and compress raw responses of existing analyses")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows rewritten per transaction")
+    parser.add_argument("--vacuum", action="store_true", help="reclaim freed pages afterwards (SQLite VACUUM / Postgres VACUUM ANALYZE)")
+    args = parser.parse_args()
+
+    init_db()
+    before = _file_size()
+    db = SessionLocal()
+    try:
+        stats = compact_analyses(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"Compacted {stats['rows']} analyses ({stats['prompts']} distinct prompts, {stats['raw_compressed']} raw responses compressed)")
+
+    if args.vacuum:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM" if engine.dialect.name == "sqlite" else "VACUUM ANALYZE"))
+        after = _file_size()
+        if before is not None and after is not None:
+            print(f"Database file: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
@@ -1,6 +1,6 @@
 from __future__ import annotations
-from typing import Generator
-from sqlalchemy import create_engine
+from typing import AsyncGenerator, Generator
+from sqlalchemy import bindparam, create_engine, event, inspect, select, text
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from pydantic_settings import BaseSettings
 import os
@@ -8,6 +8,26 @@ import os
 
 class Settings(BaseSettings):
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./perfume.db")
+    # Driver URL for the API's async engine; derived from DATABASE_URL when unset
+    async_database_url: str = os.getenv("ASYNC_DATABASE_URL", "")
+
+    # SQLite connection profile: "performance" (WAL + pragmas below) or "default" (driver defaults)
+    sqlite_profile: str = os.getenv("SQLITE_PROFILE", "performance")
+    sqlite_synchronous: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    sqlite_busy_timeout_ms: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    # Page cache is private to each connection: worst case is (pool size + overflow) x this, per engine
+    sqlite_cache_size_kib: int = int(os.getenv("SQLITE_CACHE_SIZE_KIB", "16384"))
+    # Mapped pages are shared by every connection to the file
+    sqlite_mmap_size: int = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+    sqlite_temp_store: str = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+    sqlite_optimize_on_shutdown: bool = os.getenv("SQLITE_OPTIMIZE_ON_SHUTDOWN", "true").lower() == "true"
+
+    # Connection pool, per engine (the API has a sync and an async one); with WAL every pooled
+    # SQLite connection can read concurrently, but SQLite still takes one writer at a time
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+    db_pool_timeout: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
 
     class Config:
         env_file = ".env"
@@ -16,9 +36,53 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-# For SQLite, need check_same_thread=False for multithreaded FastAPI
-connect_args = {"check_same_thread": False} if settings.database_url.startswith("sqlite") else {}
-engine = create_engine(settings.database_url, echo=False, future=True, connect_args=connect_args)
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        # For SQLite, need check_same_thread=False for multithreaded FastAPI
+        options = {"connect_args": {"check_same_thread": False, "timeout": settings.sqlite_busy_timeout_ms / 1000}}
+        if ":memory:" not in url and "mode=memory" not in url:
+            options.update(pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow, pool_timeout=settings.db_pool_timeout)
+        return options
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": True,
+    }
+
+
+def sqlite_pragmas() -> list[str]:
+    """PRAGMAs applied to every new SQLite connection for the configured profile"""
+    if settings.sqlite_profile != "performance":
+        return []
+    return [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_kib}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size}",
+        f"PRAGMA temp_store={settings.sqlite_temp_store}",
+    ]
+
+
+engine = create_engine(settings.database_url, echo=False, future=True, **_engine_options(settings.database_url))
+
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
 
@@ -34,51 +98,239 @@ def get_db() -> Generator:
         db.close()
 
 
+def async_url(url: str) -> str:
+    """Async driver equivalent of a sync DATABASE_URL (aiosqlite / asyncpg)"""
+    scheme, sep, rest = url.partition("://")
+    driver = {"sqlite": "sqlite+aiosqlite", "postgres": "postgresql+asyncpg", "postgresql": "postgresql+asyncpg", "postgresql+psycopg2": "postgresql+asyncpg"}
+    return driver.get(scheme, scheme) + sep + rest
+
+
+_async_engine = None
+_async_sessionmaker = None
+
+
+def get_async_engine():
+    """Process-wide AsyncEngine for the API, created on first use so sync-only callers don't need the async drivers"""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+        url = settings.async_database_url or async_url(settings.database_url)
+        options = _engine_options(url)
+        if url.startswith("sqlite") and "pool_size" in options:
+            # aiosqlite defaults to NullPool; keep connections (and their pragmas) around like the sync engine
+            options["poolclass"] = AsyncAdaptedQueuePool
+        _async_engine = create_async_engine(url, echo=False, **options)
+        if _async_engine.dialect.name == "sqlite":
+            event.listen(_async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        # No expiry on commit: expired attributes would need a lazy load, which AsyncSession forbids
+        _async_sessionmaker = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+
+def AsyncSessionLocal():
+    get_async_engine()
+    return _async_sessionmaker()
+
+
+async def get_async_db() -> AsyncGenerator:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
 def init_db() -> None:
-    """Initialize database and seed ingredients if empty"""
+    """Initialize database and sync ingredients with the knowledge base"""
     # Import models here to ensure metadata is populated
     from . import models  # noqa: F401
     Base.metadata.create_all(bind=engine)
+    _migrate_ingredient_normalized_name()
+    _add_missing_columns("analyses")
+    _ensure_indexes()
+    _ensure_search_index()
+
+    # Apply knowledge base edits; a no-op unless the seed file changed
+    _sync_ingredient_seed()
+
+
+def _migrate_ingredient_normalized_name() -> None:
+    """Add and backfill ingredients.normalized_name (and aliases) on databases created before they existed"""
+    from . import models
+
+    columns = {c["name"] for c in inspect(engine).get_columns("ingredients")}
+    with engine.begin() as conn:
+        if "normalized_name" not in columns:
+            conn.execute(text("ALTER TABLE ingredients ADD COLUMN normalized_name VARCHAR(255)"))
+        if "aliases" not in columns:
+            conn.execute(text("ALTER TABLE ingredients ADD COLUMN aliases TEXT"))
+
+        table = models.Ingredient.__table__
+        taken = set(conn.execute(select(table.c.normalized_name).where(table.c.normalized_name.is_not(None))).scalars())
+        updates = []
+        for row in conn.execute(select(table.c.id, table.c.name).where(table.c.normalized_name.is_(None)).order_by(table.c.id)):
+            key = models.normalize_name(row.name)
+            if key in taken:
+                # Case/whitespace duplicate of an older row: leave unindexed rather than fail the unique index
+                print(f"Warning: ingredient {row.id} ({row.name!r}) duplicates an existing name; not indexed")
+                continue
+            taken.add(key)
+            updates.append({"row_id": row.id, "normalized": key})
+        if updates:
+            conn.execute(
+                table.update().where(table.c.id == bindparam("row_id")).values(normalized_name=bindparam("normalized")),
+                updates,
+            )
+
+
+def _add_missing_columns(table_name: str) -> None:
+    """Add model columns that an existing table predates (nullable, or NOT NULL with a server default)"""
+    table = Base.metadata.tables[table_name]
+    existing = {c["name"] for c in inspect(engine).get_columns(table_name)}
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+            if column.server_default is not None:
+                default = column.server_default.arg
+                default = default if isinstance(default, str) else default.compile(dialect=engine.dialect)
+                ddl += f" NOT NULL DEFAULT {default}" if not column.nullable else f" DEFAULT {default}"
+            elif not column.nullable:
+                continue
+            conn.execute(text(ddl))
+
+
+def shutdown_db() -> None:
+    """Refresh SQLite planner statistics and close pooled connections"""
+    if engine.dialect.name == "sqlite" and settings.sqlite_optimize_on_shutdown:
+        import sqlite3
+
+        try:
+            with engine.connect() as conn:
+                # Sampled statistics keep this fast on large tables
+                conn.execute(text("PRAGMA analysis_limit=1000"))
+                if sqlite3.sqlite_version_info >= (3, 46, 0):
+                    # 0x10000: consider every table, not only those this connection queried
+                    conn.execute(text("PRAGMA optimize=0x10002"))
+                else:
+                    conn.execute(text("ANALYZE"))
+                conn.commit()
+        except Exception as e:
+            print(f"Warning: SQLite optimize failed: {e}")
+    engine.dispose()
 
-    # Seed ingredients from knowledge base if empty
-    _seed_ingredients_if_empty()
 
+def _ensure_indexes() -> None:
+    """Create indexes added to models after their table already existed"""
+    existing: set[str] | None = None
+    if engine.dialect.name == "sqlite":
+        # Reflection (checkfirst) skips expression indexes, so look them up by name instead
+        with engine.connect() as conn:
+            existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if existing is None:
+                index.create(bind=engine, checkfirst=True)
+            elif index.name not in existing:
+                index.create(bind=engine)
 
-def _seed_ingredients_if_empty() -> None:
-    """One-time seeding of ingredients from knowledge base"""
+
+_SEARCH_COLUMNS = "name, aliases, tags, cas_number"
+
+_SEARCH_INDEX_DDL = [
+    # External-content trigram index: substring and typo-tolerant typeahead over ingredients
+    f"CREATE VIRTUAL TABLE ingredients_fts USING fts5({_SEARCH_COLUMNS}, content='ingredients', content_rowid='id', tokenize='trigram')",
+    f"""CREATE TRIGGER IF NOT EXISTS ingredients_fts_ai AFTER INSERT ON ingredients BEGIN
+        INSERT INTO ingredients_fts(rowid, {_SEARCH_COLUMNS}) VALUES (new.id, new.name, new.aliases, new.tags, new.cas_number);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ingredients_fts_ad AFTER DELETE ON ingredients BEGIN
+        INSERT INTO ingredients_fts(ingredients_fts, rowid, {_SEARCH_COLUMNS}) VALUES ('delete', old.id, old.name, old.aliases, old.tags, old.cas_number);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS ingredients_fts_au AFTER UPDATE ON ingredients BEGIN
+        INSERT INTO ingredients_fts(ingredients_fts, rowid, {_SEARCH_COLUMNS}) VALUES ('delete', old.id, old.name, old.aliases, old.tags, old.cas_number);
+        INSERT INTO ingredients_fts(rowid, {_SEARCH_COLUMNS}) VALUES (new.id, new.name, new.aliases, new.tags, new.cas_number);
+    END""",
+    "INSERT INTO ingredients_fts(ingredients_fts) VALUES ('rebuild')",
+]
+
+
+def _ensure_search_index() -> None:
+    """Create the SQLite FTS5 ingredient search index; other backends use the LIKE fallback"""
+    if engine.dialect.name != "sqlite":
+        return
+    try:
+        with engine.begin() as conn:
+            if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'ingredients_fts'")).first():
+                return
+            for statement in _SEARCH_INDEX_DDL:
+                conn.execute(text(statement))
+    except Exception as e:
+        # SQLite builds without FTS5 or the trigram tokenizer (< 3.34)
+        print(f"Warning: ingredient search index unavailable: {e}")
+
+
+_SEED_PATH = os.path.join(os.path.dirname(__file__), "knowledge/ingredients_seed.json")
+_SEED_HASH_KEY = "ingredients_seed_sha256"
+
+
+def _sync_ingredient_seed(path: str = _SEED_PATH) -> None:
+    """Bring ingredients in line with the knowledge base when the seed file has changed since the last sync"""
+    import hashlib
     import json
     from . import models
+    from .services.ingredient_crud import upsert_rows
+
+    if not os.path.exists(path):
+        print(f"Warning: Knowledge base not found at {path}")
+        return
+    with open(path, "rb") as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
 
     db = SessionLocal()
     try:
-        # Check if ingredients already exist
-        if db.query(models.Ingredient).count() > 0:
-            return  # Already seeded
-
-        # Load knowledge base
-        knowledge_path = os.path.join(os.path.dirname(__file__), "knowledge/ingredients_seed.json")
-        if not os.path.exists(knowledge_path):
-            print(f"Warning: Knowledge base not found at {knowledge_path}")
+        stored = db.get(models.AppMeta, _SEED_HASH_KEY)
+        if stored is not None and stored.value == digest:
             return
 
-        with open(knowledge_path) as f:
-            data = json.load(f)
-
-        # Seed ingredients
-        for item in data:
-            ingredient = models.Ingredient(
-                name=item["name"],
-                cas_number=item.get("cas"),
-                volatility_class=item.get("volatility"),
-                tags=",".join(item.get("family", []))
-            )
-            db.add(ingredient)
+        rows = {}
+        for item in json.loads(content):
+            name = item["name"].strip()
+            rows[models.normalize_name(name)] = {
+                "name": name,
+                "normalized_name": models.normalize_name(name),
+                "cas_number": item.get("cas") or None,
+                "volatility_class": item.get("volatility") or None,
+                "tags": ",".join(item.get("family", [])) or None,
+                "aliases": ",".join(item.get("aliases", [])) or None,
+                "default_odour_notes": None,
+            }
 
+        # Seed values win where set; empty seed fields leave existing data alone.
+        # Unchanged ingredients cost no writes (see upsert_rows)
+        inserted = updated = 0
+        values = list(rows.values())
+        for start in range(0, len(values), 500):
+            _, added, changed = upsert_rows(db, values[start : start + 500])
+            inserted += added
+            updated += changed
+        if stored is None:
+            db.add(models.AppMeta(key=_SEED_HASH_KEY, value=digest))
+        else:
+            stored.value = digest
         db.commit()
-        print(f"✓ Seeded {len(data)} ingredients from knowledge base")
+        if inserted or updated:
+            print(f"✓ Synced knowledge base: {inserted} ingredients added, {updated} updated")
 
     except Exception as e:
-        print(f"Warning: Failed to seed ingredients: {e}")
+        print(f"Warning: Failed to sync ingredients: {e}")
         db.rollback()
     finally:
         db.close()
\ No newline at end of file
@@ -0,0 +1,228 @@
+"""
+Local stand-in for the Groq / OpenAI chat-completions API, for load and latency tests.
+
+    python -m app.fake_groq --port 8001 --latency lognormal:-0.5,0.6 --tokens-per-second 80 \
+        --error-rate 0.02 --malformed-rate 0.05
+    GROQ_BASE_URL=http://127.0.0.1:8001 GROQ_API_KEY=fake python -m uvicorn app.main:app
+
+Responses are synthesized by default: analysis prompts get a schema-valid
+result from the rule-based engine, repair prompts get the repaired JSON, and
+anything else gets a short canned answer. With --record, requests are proxied
+to --upstream and each exchange is appended to a JSONL file; with --replay,
+recorded responses are served for matching requests (synthesized on a miss).
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .services.analysis import REPAIR_SYSTEM_PROMPT, analyze_local
+from .services.json_stream import repair_json
+
+_FORMULA_LINE = re.compile(r"^- (.+): ([0-9.]+)%$", re.MULTILINE)
+
+
+@dataclass
+class FakeConfig:
+    latency: str = "fixed:0"  # fixed:S | uniform:LO,HI | normal:MEAN,STD | lognormal:MU,SIGMA (seconds)
+    tokens_per_second: float = 0.0  # streaming pace; 0 streams as fast as possible
+    error_rate: float = 0.0  # fraction of requests answered with 429/500
+    malformed_rate: float = 0.0  # fraction of JSON answers that are corrupted
+    record_path: str | None = None
+    replay_path: str | None = None
+    upstream: str = "https://api.groq.com"
+    seed: int | None = None
+    stats: Dict[str, int] = field(default_factory=lambda: {"requests": 0, "errors": 0, "malformed": 0, "replayed": 0, "recorded": 0})
+
+
+def sample_latency(spec: str, rng: random.Random) -> float:
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        delay = values[0] if values else 0.0
+    elif kind == "uniform":
+        delay = rng.uniform(values[0], values[1])
+    elif kind == "normal":
+        delay = rng.gauss(values[0], values[1])
+    elif kind == "lognormal":
+        delay = rng.lognormvariate(values[0], values[1])
+    else:
+        raise ValueError(f"Unknown latency distribution {kind!r}")
+    return max(0.0, delay)
+
+
+def request_key(body: dict) -> str:
+    """Replay key: the parts of a request that determine the answer"""
+    material = {k: body.get(k) for k in ("model", "messages", "response_format")}
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_recordings(path: str) -> Dict[str, str]:
+    recordings: Dict[str, str] = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            # Tolerate JSONL files with unrelated rows (e.g. a request backlog)
+            if "key" in row and "content" in row:
+                recordings[row["key"]] = row["content"]
+    return recordings
+
+
+def synthesize(body: dict) -> str:
+    messages: List[dict] = body.get("messages", [])
+    if messages and messages[0].get("content") == REPAIR_SYSTEM_PROMPT:
+        broken = messages[-1]["content"].split("JSON to fix:\n", 1)[-1]
+        return json.dumps(repair_json(broken) or {}, ensure_ascii=False)
+    user_text = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "user")
+    formula = [(name, float(pct)) for name, pct in _FORMULA_LINE.findall(user_text)]
+    if formula:
+        return analyze_local(formula)[1]
+    if body.get("response_format", {}).get("type") == "json_object":
+        return json.dumps({"answer": "This is a synthetic response from the fake Groq server."})
+    return "This is a synthetic response from the fake Groq server."
+
+
+def corrupt(content: str, rng: random.Random) -> str:
+    choice = rng.choice(["truncate", "trailing_comma", "prose"])
+    if choice == "truncate":
+        return content[: rng.randint(1, max(1, len(content) - 1))]
+    if choice == "trailing_comma" and content.endswith("}"):
+        return content[:-1] + ",}"
+    return "Here is the analysis you asked for:\n" + content
+
+
+def _completion(body: dict, content: str) -> dict:
+    prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def _chunk(chunk_id: str, model: str, delta: dict, finish_reason: str | None = None) -> str:
+    payload = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def _stream(body: dict, content: str, tokens_per_second: float):
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = body.get("model", "fake")
+    yield _chunk(chunk_id, model, {"role": "assistant", "content": ""})
+    delay = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+    # ~4 characters per token, like the usual BPE average for English/JSON
+    for i in range(0, len(content), 4):
+        if delay:
+            await asyncio.sleep(delay)
+        yield _chunk(chunk_id, model, {"content": content[i : i + 4]})
+    yield _chunk(chunk_id, model, {}, "stop")
+    yield "data: [DONE]\n\n"
+
+
+def create_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI(title="Fake Groq")
+    rng = random.Random(config.seed)
+    recordings = load_recordings(config.replay_path) if config.replay_path else {}
+    upstream = httpx.AsyncClient(base_url=config.upstream, timeout=120) if config.record_path else None
+
+    @app.on_event("shutdown")
+    async def _close() -> None:
+        if upstream is not None:
+            await upstream.aclose()
+
+    @app.get("/stats")
+    def stats() -> Dict[str, int]:
+        return config.stats
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body: Dict[str, Any] = await request.json()
+        config.stats["requests"] += 1
+        await asyncio.sleep(sample_latency(config.latency, rng))
+
+        if rng.random() < config.error_rate:
+            config.stats["errors"] += 1
+            status, kind = rng.choice([(429, "rate_limit_exceeded"), (500, "internal_server_error")])
+            return JSONResponse(status_code=status, content={"error": {"message": "Injected failure", "type": kind}})
+
+        key = request_key(body)
+        if key in recordings:
+            config.stats["replayed"] += 1
+            content = recordings[key]
+        elif upstream is not None:
+            upstream_body = dict(body, stream=False)
+            headers = {"Authorization": request.headers.get("authorization", "")}
+            resp = await upstream.post("/openai/v1/chat/completions", json=upstream_body, headers=headers)
+            if resp.status_code != 200:
+                return JSONResponse(status_code=resp.status_code, content=resp.json())
+            content = resp.json()["choices"][0]["message"]["content"] or ""
+            recordings[key] = content
+            with open(config.record_path, "a") as f:
+                f.write(json.dumps({"key": key, "request": body, "content": content}, ensure_ascii=False) + "\n")
+            config.stats["recorded"] += 1
+        else:
+            content = synthesize(body)
+
+        if rng.random() < config.malformed_rate:
+            config.stats["malformed"] += 1
+            content = corrupt(content, rng)
+
+        if body.get("stream"):
+            return StreamingResponse(_stream(body, content, config.tokens_per_second), media_type="text/event-stream")
+        return _completion(body, content)
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Groq chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="fixed:0", help="fixed:S, uniform:LO,HI, normal:MEAN,STD or lognormal:MU,SIGMA (seconds)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--record", dest="record_path", help="proxy to --upstream and append exchanges to this JSONL file")
+    parser.add_argument("--replay", dest="replay_path", help="serve recorded responses from this JSONL file")
+    parser.add_argument("--upstream", default="https://api.groq.com")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = FakeConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        malformed_rate=args.malformed_rate,
+        record_path=args.record_path,
+        replay_path=args.replay_path,
+        upstream=args.upstream,
+        seed=args.seed,
+    )
+    sample_latency(config.latency, random.Random())  # fail fast on a bad spec
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
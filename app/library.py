@@ -0,0 +1,44 @@
+"""Library backup/restore: python -m app.library export FILE [--no-analyses] | import FILE (.gz compressed by suffix; - for stdio)"""
+from __future__ import annotations
+import argparse
+import gzip
+import sys
+
+import orjson
+
+from .db import SessionLocal, init_db, shutdown_db
+from .services import library_io
+
+
+def _open(path: str, mode: str):
+    if path == "-":
+        return sys.stdout.buffer if "w" in mode else sys.stdin.buffer
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import ingredients, compounds and analyses as NDJSON")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="NDJSON file; gzip-compressed when it ends in .gz; - for stdout/stdin")
+    parser.add_argument("--no-analyses", action="store_true", help="export only ingredients and compounds")
+    parser.add_argument("--chunk-size", type=int, default=library_io.settings.library_io_chunk_size, help="rows per page / transaction")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.command == "export":
+            sections = [s for s in library_io.SECTIONS if not (args.no_analyses and s == "analysis")]
+            count = 0
+            with _open(args.path, "wb") as f:
+                for record in library_io.iter_export(db, sections, args.chunk_size):
+                    f.write(orjson.dumps(record) + b"\n")
+                    count += 1
+            print(f"Exported {count - 1} records", file=sys.stderr)
+        else:
+            with _open(args.path, "rb") as f:
+                stats = library_io.import_records(db, (orjson.loads(line) for line in f if line.strip()), args.chunk_size)
+            print(", ".join(f"{k}={v}" for k, v in stats.items()), file=sys.stderr)
+    finally:
+        db.close()
+        shutdown_db()
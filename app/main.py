@@ -1,9 +1,41 @@
+import os
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .db import init_db
-from .routers import ingredients, compounds, analyses
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic_settings import BaseSettings
+from .db import dispose_async_engine, init_db, shutdown_db
+from .services.groq_client import close_groq_clients
+from .routers import ingredients, compounds, analyses, library
+
+
+class ApiSettings(BaseSettings):
+    # Responses at least this many bytes are gzipped for clients that accept it; 0 disables
+    api_gzip_minimum_size: int = int(os.getenv("API_GZIP_MINIMUM_SIZE", "1024"))
+    # zlib level 1-9; 9 costs several times the CPU of 5-6 for a few percent smaller bodies
+    api_gzip_level: int = int(os.getenv("API_GZIP_LEVEL", "5"))
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+settings = ApiSettings()
 
-app = FastAPI(title="Perfume Compound AI", version="0.1.0")
+# Server-Sent Events must reach the client as they are produced, not in gzip blocks
+_UNCOMPRESSED_PREFIXES = ("/analyses/stream/",)
+
+
+class _GZipMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(_UNCOMPRESSED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+app = FastAPI(title="Perfume Compound AI", version="0.1.0", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,11 +44,20 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.api_gzip_minimum_size > 0:
+    app.add_middleware(_GZipMiddleware, minimum_size=settings.api_gzip_minimum_size, compresslevel=settings.api_gzip_level)
 
 @app.on_event("startup")
 def on_startup() -> None:
     init_db()
 
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await close_groq_clients()
+    await dispose_async_engine()
+    shutdown_db()
+
 app.include_router(ingredients.router, prefix="/ingredients", tags=["ingredients"])
 app.include_router(compounds.router, prefix="/compounds", tags=["compounds"])
-app.include_router(analyses.router, prefix="/analyses", tags=["analyses"])
\ No newline at end of file
+app.include_router(analyses.router, prefix="/analyses", tags=["analyses"])
+app.include_router(library.router, tags=["library"])
\ No newline at end of file
@@ -1,8 +1,19 @@
 from __future__ import annotations
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, Float, ForeignKey, Text, JSON, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
+from sqlalchemy import Integer, String, Float, ForeignKey, Text, JSON, DateTime, Boolean, Index, LargeBinary, false, func
+from sqlalchemy.dialects import sqlite
 from .db import Base
 
+# Written like SQLite's CURRENT_TIMESTAMP defaults (whole seconds), so stored text sorts and compares consistently
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"), "sqlite"
+)
+
+
+def normalize_name(name: str) -> str:
+    """Lookup key for ingredient names: casefolded, whitespace collapsed"""
+    return " ".join(name.split()).casefold()
+
 
 class User(Base):
     __tablename__ = "users"
@@ -19,13 +30,21 @@ class Ingredient(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     name: Mapped[str] = mapped_column(String(255), unique=True, index=True)
+    # Equality lookups go through this so the unique index can be used
+    normalized_name: Mapped[str | None] = mapped_column(String(255), unique=True, index=True, nullable=True)
     cas_number: Mapped[str | None] = mapped_column(String(64), nullable=True)
     tags: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    aliases: Mapped[str | None] = mapped_column(Text, nullable=True)  # comma-separated, like tags
     volatility_class: Mapped[str | None] = mapped_column(String(32), nullable=True)  # top|heart|base
     default_odour_notes: Mapped[str | None] = mapped_column(Text, nullable=True)
 
     compound_ingredients: Mapped[list[CompoundIngredient]] = relationship("CompoundIngredient", back_populates="ingredient")
 
+    @validates("name")
+    def _sync_normalized_name(self, key: str, value: str) -> str:
+        self.normalized_name = normalize_name(value)
+        return value
+
 
 class Compound(Base):
     __tablename__ = "compounds"
@@ -34,19 +53,26 @@ class Compound(Base):
     user_id: Mapped[int | None] = mapped_column(ForeignKey("users.id"), nullable=True)
     name: Mapped[str] = mapped_column(String(255), index=True)
     description: Mapped[str | None] = mapped_column(Text, nullable=True)
-    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
-    updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    created_at: Mapped[str] = mapped_column(Timestamp, server_default=func.now())
+    updated_at: Mapped[str] = mapped_column(Timestamp, server_default=func.now(), onupdate=func.now())
 
     user: Mapped[User | None] = relationship("User", back_populates="compounds")
     ingredients: Mapped[list[CompoundIngredient]] = relationship("CompoundIngredient", back_populates="compound", cascade="all, delete-orphan")
     analyses: Mapped[list[Analysis]] = relationship("Analysis", back_populates="compound", cascade="all, delete-orphan")
 
+    # Keyset pagination of the library listing; SQLite pages on datetime(updated_at), which
+    # evens out stored timestamps with and without fractional seconds
+    __table_args__ = (
+        Index("ix_compounds_updated_at_id", "updated_at", "id").ddl_if(callable_=lambda ddl, target, bind, **kw: bind.dialect.name != "sqlite"),
+        Index("ix_compounds_updated_second_id", func.datetime(updated_at), "id").ddl_if(dialect="sqlite"),
+    )
+
 
 class CompoundIngredient(Base):
     __tablename__ = "compound_ingredients"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    compound_id: Mapped[int] = mapped_column(ForeignKey("compounds.id", ondelete="CASCADE"))
+    compound_id: Mapped[int] = mapped_column(ForeignKey("compounds.id", ondelete="CASCADE"), index=True)
     ingredient_id: Mapped[int] = mapped_column(ForeignKey("ingredients.id"))
     percentage: Mapped[float] = mapped_column(Float)
 
@@ -61,9 +87,69 @@ class Analysis(Base):
     compound_id: Mapped[int] = mapped_column(ForeignKey("compounds.id", ondelete="CASCADE"))
     model: Mapped[str] = mapped_column(String(128))
     prompt_version: Mapped[str] = mapped_column(String(64))
+    # Prompts are stored once in `prompts`; see services/analysis_store for reading and writing these columns
+    prompt_hash: Mapped[str | None] = mapped_column(ForeignKey("prompts.hash"), nullable=True, index=True)
+    # Heavy payload columns load only when accessed (or via undefer); listings never touch them
+    result_json: Mapped[dict | None] = mapped_column(JSON, nullable=True, deferred=True)
+    # zlib-compressed raw response, kept only when it differs from json.dumps(result_json)
+    raw_response_z: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True, deferred=True)
+    # Inline copies written before prompt dedup / compression; empty once compacted
+    legacy_prompt_text: Mapped[str] = mapped_column("prompt_text", Text, default="", deferred=True)
+    legacy_raw_response: Mapped[str] = mapped_column("raw_response", Text, default="", deferred=True)
+    # Exempt from retention pruning (see services/retention)
+    pinned: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false())
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    compound: Mapped[Compound] = relationship("Compound", back_populates="analyses")
+
+    # Per-compound history, newest first, paged by id
+    __table_args__ = (Index("ix_analyses_compound_id_id", "compound_id", "id"),)
+
+
+class Prompt(Base):
+    __tablename__ = "prompts"
+
+    # Content address (sha256 of text) shared by every analysis that used the prompt
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    text: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class AnalysisCacheEntry(Base):
+    __tablename__ = "analysis_cache"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)  # sha256 of formula + model + prompt/schema
+    model: Mapped[str] = mapped_column(String(128))
+    prompt_version: Mapped[str] = mapped_column(String(64))
     prompt_text: Mapped[str] = mapped_column(Text)
     raw_response: Mapped[str] = mapped_column(Text)
     result_json: Mapped[dict | None] = mapped_column(JSON, nullable=True)
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
-    compound: Mapped[Compound] = relationship("Compound", back_populates="analyses")
\ No newline at end of file
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    compound_id: Mapped[int] = mapped_column(ForeignKey("compounds.id", ondelete="CASCADE"), index=True)
+    status: Mapped[str] = mapped_column(String(16), index=True, default="queued")  # queued|running|succeeded|failed
+    force: Mapped[bool] = mapped_column(Boolean, default=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=3)
+    available_at: Mapped[str] = mapped_column(DateTime(timezone=True), index=True)  # not claimable before this
+    locked_by: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    locked_until: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)  # visibility timeout
+    analysis_id: Mapped[int | None] = mapped_column(ForeignKey("analyses.id", ondelete="SET NULL"), nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    started_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class AppMeta(Base):
+    __tablename__ = "app_meta"
+
+    # Small key/value bookkeeping, e.g. the hash of the last applied ingredient seed
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[str] = mapped_column(Text)
+    updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,34 @@
+"""Analysis retention: python -m app.retention [--keep N] [--batch-size N] | --restore FILE... [--pin] [--compound-id ID]"""
+from __future__ import annotations
+import argparse
+
+from .db import SessionLocal, init_db, shutdown_db
+from .services.retention import prune_analyses, read_archive, restore_analyses, settings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive analyses beyond the retention window, or restore archived ones")
+    parser.add_argument("--keep", type=int, default=settings.analysis_retention_keep, help="newest analyses kept per compound (pinned ones are always kept)")
+    parser.add_argument("--archive-dir", default=settings.analysis_archive_dir)
+    parser.add_argument("--batch-size", type=int, default=settings.analysis_retention_batch_size, help="rows per transaction")
+    parser.add_argument("--restore", nargs="+", metavar="FILE", help="re-import these .ndjson.gz archives instead of pruning")
+    parser.add_argument("--pin", action="store_true", help="pin restored analyses so the next pass keeps them")
+    parser.add_argument("--compound-id", type=int, help="only restore this compound's analyses")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.restore:
+            for path in args.restore:
+                stats = restore_analyses(db, read_archive(path), pin=args.pin, compound_id=args.compound_id, batch_size=args.batch_size)
+                print(f"{path}: restored {stats['restored']}, skipped {stats['skipped']}")
+        else:
+            stats = prune_analyses(db, keep=args.keep, archive_dir=args.archive_dir, batch_size=args.batch_size)
+            print(
+                f"Archived {stats['archived']} analyses in {stats['batches']} batches to {stats['files']} files "
+                f"under {args.archive_dir}; {stats['prompts_deleted']} unused prompts deleted"
+            )
+    finally:
+        db.close()
+        shutdown_db()
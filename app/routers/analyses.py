@@ -1,45 +1,284 @@
 from __future__ import annotations
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from ..db import get_db
+from ..db import get_async_db, AsyncSessionLocal
 from .. import models, schemas
-from ..services.analysis import analyze_formula
-from ..services.groq_client import get_groq_model_name
+from ..services.analysis import (
+    analyze_formula_async,
+    analyze_formulas,
+    analyze_local,
+    stream_analysis,
+    formula_cache_key,
+    resolve_mode,
+    result_provenance,
+    settings as analysis_settings,
+)
+from ..services import analysis_cache, analysis_store, jobs
 
 router = APIRouter()
 
 
-@router.post("/run/{compound_id}", response_model=schemas.AnalysisRead)
-def run_analysis(compound_id: int, db: Session = Depends(get_db)):
-    compound = db.get(models.Compound, compound_id)
-    if not compound:
+async def _get_formula(db: AsyncSession, compound_id: int) -> list[tuple[str, float]]:
+    """(ingredient name, percentage) lines of a compound; 404 if it doesn't exist"""
+    if await db.get(models.Compound, compound_id) is None:
         raise HTTPException(status_code=404, detail="Compound not found")
+    stmt = (
+        select(models.Ingredient.name, models.CompoundIngredient.percentage)
+        .join(models.Ingredient, models.Ingredient.id == models.CompoundIngredient.ingredient_id)
+        .where(models.CompoundIngredient.compound_id == compound_id)
+        .order_by(models.CompoundIngredient.id)
+    )
+    return [(name, percentage) for name, percentage in await db.execute(stmt)]
+
 
-    formula = [(ci.ingredient.name, ci.percentage) for ci in compound.ingredients]
+@router.post("/run/{compound_id}", response_model=schemas.AnalysisRead)
+async def run_analysis(
+    compound_id: int,
+    response: Response,
+    force: bool = False,
+    run_async: bool = Query(False, alias="async"),
+    mode: str | None = Query(None, pattern="^(local|llm|hybrid)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    formula = await _get_formula(db, compound_id)
     if not formula:
         raise HTTPException(status_code=400, detail="Compound has no ingredients")
 
-    prompt_text, raw_response, parsed = analyze_formula(formula)
+    mode = resolve_mode(mode)
+    if run_async and mode == "llm":
+        job = await db.run_sync(jobs.enqueue_analysis, compound_id, force)
+        return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status})
+
+    if mode == "llm":
+        prompt_text, raw_response, parsed = await analyze_formula_async(formula, db=db, force=force)
+    else:
+        prompt_text, raw_response, parsed = analyze_local(formula)
+
+    model, prompt_version = result_provenance(mode)
+    analysis = await db.run_sync(analysis_store.add_analysis, compound_id, model, prompt_version, prompt_text, raw_response, parsed)
+    await db.commit()
+    await db.refresh(analysis, attribute_names=["created_at"])
+
+    if mode == "hybrid":
+        # Local result now; the LLM refinement lands as a separate Analysis via the job queue
+        job = await db.run_sync(jobs.enqueue_analysis, compound_id, force)
+        response.headers["X-Refine-Job-Id"] = str(job.id)
+
+    return {
+        "id": analysis.id,
+        "compound_id": compound_id,
+        "model": model,
+        "prompt_version": prompt_version,
+        "prompt_text": prompt_text,
+        "raw_response": raw_response,
+        "result_json": parsed,
+        "created_at": analysis.created_at,
+    }
+
+
+async def _analyze_locally(formulas: dict[int, list[tuple[str, float]]]):
+    for compound_id, formula in formulas.items():
+        try:
+            yield compound_id, analyze_local(formula), None
+        except Exception as e:
+            yield compound_id, None, e
+
 
-    analysis = models.Analysis(
-        compound_id=compound.id,
-        model=get_groq_model_name(),
-        prompt_version="v1",
-        prompt_text=prompt_text,
-        raw_response=raw_response,
-        result_json=parsed,
+@router.post("/run_batch", response_model=schemas.AnalysisBatchResult)
+async def run_analysis_batch(data: schemas.AnalysisBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    # Compounds and their formula lines in one query
+    stmt = (
+        select(models.Compound.id, models.Ingredient.name, models.CompoundIngredient.percentage)
+        .outerjoin(models.CompoundIngredient, models.CompoundIngredient.compound_id == models.Compound.id)
+        .outerjoin(models.Ingredient, models.Ingredient.id == models.CompoundIngredient.ingredient_id)
+        .order_by(models.Compound.id, models.CompoundIngredient.id)
     )
-    db.add(analysis)
-    db.commit()
-    db.refresh(analysis)
+    if data.compound_ids is not None:
+        stmt = stmt.where(models.Compound.id.in_(data.compound_ids))
+    if data.name_contains:
+        stmt = stmt.where(models.Compound.name.ilike(f"%{data.name_contains}%"))
+
+    formulas: dict[int, list[tuple[str, float]]] = {}
+    for compound_id, ingredient_name, percentage in await db.execute(stmt):
+        lines = formulas.setdefault(compound_id, [])
+        if ingredient_name is not None:
+            lines.append((ingredient_name, percentage))
+
+    results: list[schemas.AnalysisBatchItem] = []
+    for compound_id in data.compound_ids or []:
+        if compound_id not in formulas:
+            results.append(schemas.AnalysisBatchItem(compound_id=compound_id, status="not_found", detail="Compound not found"))
+    for compound_id in [cid for cid, lines in formulas.items() if not lines]:
+        del formulas[compound_id]
+        results.append(schemas.AnalysisBatchItem(compound_id=compound_id, status="skipped", detail="Compound has no ingredients"))
+
+    mode = resolve_mode(data.mode)
+    concurrency = min(data.concurrency or analysis_settings.analysis_batch_concurrency, analysis_settings.analysis_batch_concurrency)
+    model, prompt_version = result_provenance(mode)
+    pending: list[dict] = []
+
+    async def _flush() -> None:
+        # Rows are written and committed together so no write transaction stays open across awaits
+        analyses = await db.run_sync(analysis_store.add_analyses, pending)
+        await db.commit()
+        for analysis in analyses:
+            results.append(schemas.AnalysisBatchItem(compound_id=analysis.compound_id, status="ok", analysis_id=analysis.id))
+        pending.clear()
+
+    # Separate session so cache writes don't commit half-built chunks
+    cache_db = AsyncSessionLocal()
+    try:
+        if mode == "llm":
+            outcomes = analyze_formulas(formulas, concurrency, db=cache_db, force=data.force)
+        else:
+            outcomes = _analyze_locally(formulas)
+        async for compound_id, output, error in outcomes:
+            if error is not None:
+                results.append(schemas.AnalysisBatchItem(compound_id=compound_id, status="error", detail=str(error)))
+                continue
+            prompt_text, raw_response, parsed = output
+            pending.append(
+                {
+                    "compound_id": compound_id,
+                    "model": model,
+                    "prompt_version": prompt_version,
+                    "prompt_text": prompt_text,
+                    "raw_response": raw_response,
+                    "result": parsed,
+                }
+            )
+            if len(pending) >= analysis_settings.analysis_batch_commit_size:
+                await _flush()
+        await _flush()
+    finally:
+        await cache_db.close()
+
+    if mode == "hybrid":
+        queued = await db.run_sync(jobs.enqueue_analyses, [r.compound_id for r in results if r.status == "ok"], data.force)
+        for r in results:
+            if r.compound_id in queued:
+                r.job_id = queued[r.compound_id].id
+
+    succeeded = sum(1 for r in results if r.status == "ok")
+    return schemas.AnalysisBatchResult(total=len(results), succeeded=succeeded, results=results)
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 
+@router.get("/stream/{compound_id}")
+async def stream_analysis_events(
+    compound_id: int,
+    force: bool = False,
+    mode: str | None = Query(None, pattern="^(local|llm|hybrid)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    formula = await _get_formula(db, compound_id)
+    if not formula:
+        raise HTTPException(status_code=400, detail="Compound has no ingredients")
+
+    mode = resolve_mode(mode)
+    # The final result of llm and hybrid streams comes from the LLM
+    model, prompt_version = result_provenance("local" if mode == "local" else "llm")
+
+    async def events():
+        # Own session: the request-scoped one is closed before the body streams
+        stream_db = AsyncSessionLocal()
+        try:
+            async for kind, payload in stream_analysis(formula, db=stream_db, force=force, mode=mode):
+                if kind == "local":
+                    yield _sse("local", {"result": payload})
+                elif kind == "token":
+                    yield _sse("token", {"delta": payload})
+                elif kind == "field":
+                    yield _sse("field", {"key": payload[0], "value": payload[1]})
+                else:
+                    prompt_text, raw_response, parsed = payload
+                    analysis = await stream_db.run_sync(
+                        analysis_store.add_analysis, compound_id, model, prompt_version, prompt_text, raw_response, parsed
+                    )
+                    await stream_db.commit()
+                    yield _sse("done", {"analysis_id": analysis.id, "result": parsed})
+        except Exception as e:
+            yield _sse("error", {"detail": f"{type(e).__name__}: {e}"})
+        finally:
+            await stream_db.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.AnalysisJobRead)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    job = await db.get(models.AnalysisJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _parse_fields(fields: str | None) -> list[str]:
+    if not fields:
+        return analysis_store.SUMMARY_FIELDS
+    names = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [n for n in names if n not in analysis_store.FIELDS]
+    if unknown or not names:
+        raise HTTPException(status_code=422, detail=f"Unknown fields {unknown}; choose from {sorted(analysis_store.FIELDS)}")
+    return names
+
+
+@router.get("/by_compound/{compound_id}", response_model=schemas.AnalysisPage)
+async def list_analyses(
+    compound_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    fields: str | None = Query(None, description="Comma-separated columns; defaults to the summary projection"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    names = _parse_fields(fields)
+    if cursor and not cursor.isdigit():
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    rows = await db.run_sync(analysis_store.list_for_compound, compound_id, names, limit + 1, int(cursor) if cursor else None)
+    next_cursor = str(rows[limit - 1]["id"]) if len(rows) > limit else None
+    # Rows are projected straight from the DB; serialize without re-validating them as AnalysisPage
+    return ORJSONResponse({"items": [{n: row[n] for n in names} for row in rows[:limit]], "next_cursor": next_cursor})
+
+
+@router.get("/{analysis_id}", response_model=schemas.AnalysisRead)
+async def get_analysis(analysis_id: int, db: AsyncSession = Depends(get_async_db)):
+    analysis = await db.run_sync(analysis_store.get_full, analysis_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
     return analysis
 
 
-@router.get("/by_compound/{compound_id}", response_model=List[schemas.AnalysisRead])
-def list_analyses(compound_id: int, db: Session = Depends(get_db)):
-    stmt = select(models.Analysis).where(models.Analysis.compound_id == compound_id).order_by(models.Analysis.id.desc())
-    results = db.execute(stmt).scalars().all()
-    return results
\ No newline at end of file
+@router.put("/{analysis_id}/pin")
+async def pin_analysis(analysis_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Keep an analysis out of retention pruning"""
+    if not await db.run_sync(analysis_store.set_pinned, analysis_id, True):
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return {"id": analysis_id, "pinned": True}
+
+
+@router.delete("/{analysis_id}/pin")
+async def unpin_analysis(analysis_id: int, db: AsyncSession = Depends(get_async_db)):
+    if not await db.run_sync(analysis_store.set_pinned, analysis_id, False):
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return {"id": analysis_id, "pinned": False}
+
+
+@router.delete("/cache")
+async def clear_analysis_cache(db: AsyncSession = Depends(get_async_db)):
+    return {"deleted": await db.run_sync(analysis_cache.invalidate)}
+
+
+@router.delete("/cache/{compound_id}")
+async def invalidate_compound_analysis(compound_id: int, db: AsyncSession = Depends(get_async_db)):
+    formula = await _get_formula(db, compound_id)
+    return {"deleted": await db.run_sync(analysis_cache.invalidate, formula_cache_key(formula))}
\ No newline at end of file
@@ -1,83 +1,91 @@
 from __future__ import annotations
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import select, delete
-from ..db import get_db
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func
+from ..db import get_async_db
 from .. import models, schemas
+from ..services import compound_cache, compound_crud, ingredient_crud
 
 router = APIRouter()
 
 
-def _get_or_create_ingredient(db: Session, name: str) -> models.Ingredient:
-    result = db.execute(select(models.Ingredient).where(models.Ingredient.name.ilike(name))).scalar_one_or_none()
-    if result:
-        return result
-    ingredient = models.Ingredient(name=name.strip())
-    db.add(ingredient)
-    db.flush()
-    return ingredient
-
-
-@router.post("", response_model=schemas.CompoundRead)
-def create_compound(data: schemas.CompoundCreate, db: Session = Depends(get_db)):
-    compound = models.Compound(name=data.name, description=data.description)
-    db.add(compound)
-    db.flush()
-
-    items_out: list[dict] = []
-    for item in data.items:
+async def _resolve_items(db: AsyncSession, items: List[schemas.CompoundIngredientIn]) -> list[dict]:
+    for item in items:
         if item.ingredient_id is None and not item.ingredient_name:
             raise HTTPException(status_code=400, detail="Each item requires ingredient_id or ingredient_name")
+    by_id, by_key = await db.run_sync(
+        ingredient_crud.resolve_ingredients,
+        [item.ingredient_id for item in items if item.ingredient_id is not None],
+        [item.ingredient_name for item in items if item.ingredient_id is None],
+    )
+    items_out: list[dict] = []
+    for item in items:
         if item.ingredient_id is not None:
-            ingredient = db.get(models.Ingredient, item.ingredient_id)
-            if not ingredient:
+            if item.ingredient_id not in by_id:
                 raise HTTPException(status_code=404, detail=f"Ingredient {item.ingredient_id} not found")
+            ingredient_id, ingredient_name = item.ingredient_id, by_id[item.ingredient_id]
         else:
-            ingredient = _get_or_create_ingredient(db, item.ingredient_name or "")
-        ci = models.CompoundIngredient(compound_id=compound.id, ingredient_id=ingredient.id, percentage=item.percentage)
-        db.add(ci)
-        items_out.append({"ingredient_id": ingredient.id, "ingredient_name": ingredient.name, "percentage": item.percentage})
-    db.commit()
+            ingredient_id, ingredient_name = by_key[models.normalize_name(item.ingredient_name)]
+        items_out.append({"ingredient_id": ingredient_id, "ingredient_name": ingredient_name, "percentage": item.percentage})
+    return items_out
+
+
+@router.post("", response_model=schemas.CompoundRead)
+async def create_compound(data: schemas.CompoundCreate, db: AsyncSession = Depends(get_async_db)):
+    items_out = await _resolve_items(db, data.items)
+    compound = models.Compound(name=data.name, description=data.description)
+    db.add(compound)
+    await db.flush()
+    await db.run_sync(compound_crud.add_items, compound.id, [(i["ingredient_id"], i["percentage"]) for i in items_out])
+    await db.commit()
     return {"id": compound.id, "name": compound.name, "description": compound.description, "items": items_out}
 
 
-@router.get("/{compound_id}", response_model=schemas.CompoundRead)
-def get_compound(compound_id: int, db: Session = Depends(get_db)):
-    compound = db.get(models.Compound, compound_id)
-    if not compound:
+@router.get("/{compound_id}", response_model=schemas.CompoundRead, responses={304: {"description": "Not modified (If-None-Match)"}})
+async def get_compound(
+    compound_id: int,
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Cache hits run no queries; the body is pre-serialized and its hash is the ETag
+    cached = compound_cache.get(compound_id) or await db.run_sync(compound_crud.load_compound, compound_id)
+    if cached is None:
         raise HTTPException(status_code=404, detail="Compound not found")
-    items = [
-        {"ingredient_id": ci.ingredient_id, "ingredient_name": ci.ingredient.name, "percentage": ci.percentage}
-        for ci in compound.ingredients
-    ]
-    return {"id": compound.id, "name": compound.name, "description": compound.description, "items": items}
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if compound_cache.etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
 
 
 @router.put("/{compound_id}", response_model=schemas.CompoundRead)
-def update_compound(compound_id: int, data: schemas.CompoundCreate, db: Session = Depends(get_db)):
-    compound = db.get(models.Compound, compound_id)
+async def update_compound(compound_id: int, data: schemas.CompoundCreate, db: AsyncSession = Depends(get_async_db)):
+    compound = await db.get(models.Compound, compound_id)
     if not compound:
         raise HTTPException(status_code=404, detail="Compound not found")
+    # Unchanged values leave the row clean, so no UPDATE is issued for them
     compound.name = data.name
     compound.description = data.description
 
-    # Delete existing items
-    db.execute(delete(models.CompoundIngredient).where(models.CompoundIngredient.compound_id == compound.id))
-    db.flush()
+    items_out = await _resolve_items(db, data.items)
+    if await db.run_sync(compound_crud.sync_items, compound.id, [(i["ingredient_id"], i["percentage"]) for i in items_out]):
+        compound.updated_at = func.now()
+    changed = db.is_modified(compound)
+    await db.commit()
+    if changed:
+        compound_cache.invalidate(compound_id)
+    return {"id": compound.id, "name": compound.name, "description": compound.description, "items": items_out}
 
-    items_out: list[dict] = []
-    for item in data.items:
-        if item.ingredient_id is None and not item.ingredient_name:
-            raise HTTPException(status_code=400, detail="Each item requires ingredient_id or ingredient_name")
-        if item.ingredient_id is not None:
-            ingredient = db.get(models.Ingredient, item.ingredient_id)
-            if not ingredient:
-                raise HTTPException(status_code=404, detail=f"Ingredient {item.ingredient_id} not found")
-        else:
-            ingredient = _get_or_create_ingredient(db, item.ingredient_name or "")
-        ci = models.CompoundIngredient(compound_id=compound.id, ingredient_id=ingredient.id, percentage=item.percentage)
-        db.add(ci)
-        items_out.append({"ingredient_id": ingredient.id, "ingredient_name": ingredient.name, "percentage": item.percentage})
-    db.commit()
-    return {"id": compound.id, "name": compound.name, "description": compound.description, "items": items_out}
\ No newline at end of file
+
+@router.patch("/{compound_id}/items", response_model=schemas.CompoundRead)
+async def patch_compound_items(compound_id: int, data: schemas.CompoundItemsPatch, db: AsyncSession = Depends(get_async_db)):
+    compound = await db.get(models.Compound, compound_id)
+    if not compound:
+        raise HTTPException(status_code=404, detail="Compound not found")
+    upserts = await _resolve_items(db, data.upsert)
+    if await db.run_sync(compound_crud.patch_items, compound.id, [(i["ingredient_id"], i["percentage"]) for i in upserts], data.remove):
+        compound.updated_at = func.now()
+        await db.commit()
+        compound_cache.invalidate(compound_id)
+    items = await db.run_sync(compound_crud.get_items, compound.id)
+    return {"id": compound.id, "name": compound.name, "description": compound.description, "items": items}
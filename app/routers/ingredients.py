@@ -1,52 +1,95 @@
 from __future__ import annotations
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from ..db import get_db
+from ..db import get_async_db
 from .. import models, schemas
+from ..services import ingredient_crud
+from ..services.ingredient_search import search_ingredients
 
 router = APIRouter()
 
+_ITEMS = TypeAdapter(List[schemas.IngredientCreate])
 
-@router.post("/bulk_upsert", response_model=List[schemas.IngredientRead])
-def bulk_upsert_ingredients(items: List[schemas.IngredientCreate], db: Session = Depends(get_db)):
-    created_or_existing: list[models.Ingredient] = []
-    for item in items:
-        name = item.name.strip()
-        result = db.execute(select(models.Ingredient).where(models.Ingredient.name.ilike(name))).scalar_one_or_none()
-        if result is None:
-            ingredient = models.Ingredient(
-                name=name,
-                cas_number=item.cas_number,
-                tags=",".join(item.tags) if item.tags else None,
-                volatility_class=item.volatility_class,
-                default_odour_notes=item.default_odour_notes,
-            )
-            db.add(ingredient)
-            db.flush()
-            created_or_existing.append(ingredient)
-        else:
-            # Update select fields
-            if item.cas_number:
-                result.cas_number = item.cas_number
-            if item.tags:
-                result.tags = ",".join(item.tags)
-            if item.volatility_class:
-                result.volatility_class = item.volatility_class
-            if item.default_odour_notes:
-                result.default_odour_notes = item.default_odour_notes
-            created_or_existing.append(result)
-    db.commit()
-    return created_or_existing
+
+async def _bulk_upsert_ndjson(request: Request, db: AsyncSession, chunk_size: int) -> dict:
+    stats = {"received": 0, "inserted": 0, "updated": 0, "chunks": 0}
+    chunk: list[dict] = []
+    line_no = 0
+
+    async def _flush() -> None:
+        _, inserted, updated = await db.run_sync(ingredient_crud.upsert_rows, chunk)
+        await db.commit()
+        stats["inserted"] += inserted
+        stats["updated"] += updated
+        stats["chunks"] += 1
+        chunk.clear()
+
+    async def _lines():
+        pending = b""
+        async for data in request.stream():
+            pending += data
+            *complete, pending = pending.split(b"\n")
+            for line in complete:
+                yield line
+        yield pending
+
+    async for line in _lines():
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            item = schemas.IngredientCreate.model_validate_json(line)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail={"line": line_no, "errors": e.errors(include_url=False, include_input=False), **stats})
+        chunk.append(ingredient_crud.to_row(item))
+        stats["received"] += 1
+        if len(chunk) >= chunk_size:
+            await _flush()
+    if chunk:
+        await _flush()
+    return stats
+
+
+@router.post("/bulk_upsert", response_model=None)
+async def bulk_upsert_ingredients(request: Request, chunk_size: Optional[int] = Query(None, ge=1), db: AsyncSession = Depends(get_async_db)):
+    """
+    Body is either a JSON array of ingredients (returns the stored rows) or, with
+    Content-Type: application/x-ndjson, one ingredient per line (returns counters).
+    """
+    chunk_size = chunk_size or ingredient_crud.settings.ingredient_upsert_chunk_size
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        return await _bulk_upsert_ndjson(request, db, chunk_size)
+
+    try:
+        items = _ITEMS.validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_input=False)])
+    await db.run_sync(ingredient_crud.bulk_upsert, items, chunk_size)
+    keys = [models.normalize_name(item.name) for item in items]
+    stored = await db.run_sync(ingredient_crud.get_by_normalized_names, keys, chunk_size)
+    return [ingredient_crud.to_read(stored[key]) for key in keys if key in stored]
+
+
+@router.get("/search", response_model=List[schemas.IngredientSearchHit])
+async def search(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=100), db: AsyncSession = Depends(get_async_db)):
+    """Typeahead over name, aliases, tags and CAS number, best match first"""
+    # Built from DB rows by to_read, so response_model re-validation is skipped
+    return ORJSONResponse(await db.run_sync(search_ingredients, q, limit))
 
 
 @router.get("", response_model=List[schemas.IngredientRead])
-def list_ingredients(q: Optional[str] = Query(None), limit: int = 100, db: Session = Depends(get_db)):
-    stmt = select(models.Ingredient)
+async def list_ingredients(q: Optional[str] = Query(None), limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    table = models.Ingredient.__table__
+    # Plain rows, no ORM identity map; to_read output already matches IngredientRead
+    stmt = select(table)
     if q:
         like = f"%{q}%"
-        stmt = stmt.where(models.Ingredient.name.ilike(like))
+        stmt = stmt.where(table.c.name.ilike(like))
     stmt = stmt.limit(limit)
-    results = db.execute(stmt).scalars().all()
-    return results
\ No newline at end of file
+    results = (await db.execute(stmt)).all()
+    return ORJSONResponse([ingredient_crud.to_read(row) for row in results])
\ No newline at end of file
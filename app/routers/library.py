@@ -0,0 +1,89 @@
+from __future__ import annotations
+import zlib
+from datetime import date
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db import AsyncSessionLocal, get_async_db
+from ..services import library_io
+
+router = APIRouter()
+
+
+@router.get("/export")
+async def export_library(
+    analyses: bool = Query(True, description="Include analyses (usually the bulk of the export)"),
+    chunk_size: Optional[int] = Query(None, ge=1, le=10000),
+):
+    """
+    Stream the library as NDJSON: a header line, then ingredients, compounds
+    (with formula lines) and analyses grouped by compound. POST /import reads it back.
+    """
+    chunk_size = chunk_size or library_io.settings.library_io_chunk_size
+    sections = [s for s in library_io.SECTIONS if analyses or s != "analysis"]
+
+    async def lines():
+        # Own session: the request-scoped one is closed before the body streams
+        db = AsyncSessionLocal()
+        try:
+            await db.run_sync(library_io.begin_snapshot)
+            yield orjson.dumps(library_io.header()) + b"\n"
+            for section in sections:
+                cursor = None
+                while True:
+                    records, cursor = await db.run_sync(library_io.export_page, section, cursor, chunk_size)
+                    if cursor is None:
+                        break
+                    yield b"".join(orjson.dumps(record) + b"\n" for record in records)
+        finally:
+            await db.close()
+
+    filename = f"perfume-library-{date.today().isoformat()}.ndjson"
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+async def _body_lines(request: Request):
+    # Content-Encoding: gzip bodies (e.g. a saved compressed export) are inflated as they arrive
+    inflate = zlib.decompressobj(wbits=31) if request.headers.get("content-encoding", "").lower() == "gzip" else None
+    pending = b""
+    async for data in request.stream():
+        pending += inflate.decompress(data) if inflate else data
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            yield line
+    if inflate:
+        pending += inflate.flush()
+    yield pending
+
+
+@router.post("/import")
+async def import_library(request: Request, chunk_size: Optional[int] = Query(None, ge=1, le=10000), db: AsyncSession = Depends(get_async_db)):
+    """
+    Import a GET /export stream (NDJSON, optionally gzip-encoded), committing per chunk.
+    Source ids are remapped, and re-importing the same export changes nothing.
+    """
+    state = library_io.ImportState(chunk_size=chunk_size or library_io.settings.library_io_chunk_size)
+    line_no = 0
+    try:
+        async for line in _body_lines(request):
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError as e:
+                raise library_io.LibraryFormatError(f"Invalid JSON: {e}")
+            ready = state.add(record)
+            if ready:
+                await db.run_sync(library_io.import_chunk, *ready, state)
+        ready = state.drain()
+        if ready:
+            await db.run_sync(library_io.import_chunk, *ready, state)
+    except (library_io.LibraryFormatError, zlib.error) as e:
+        # Chunks before the failing one stay committed; the counters say how far the import got
+        raise HTTPException(status_code=422, detail={"line": line_no, "error": str(e), **state.stats})
+    return state.stats
\ No newline at end of file
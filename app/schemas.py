@@ -1,4 +1,5 @@
 from __future__ import annotations
+from datetime import datetime
 from typing import List, Optional
 from pydantic import BaseModel, Field
 
@@ -7,6 +8,7 @@ class IngredientBase(BaseModel):
     name: str
     cas_number: Optional[str] = None
     tags: Optional[List[str]] = None
+    aliases: Optional[List[str]] = None
     volatility_class: Optional[str] = Field(None, pattern="^(top|heart|base)$")
     default_odour_notes: Optional[str] = None
 
@@ -22,6 +24,10 @@ class IngredientRead(IngredientBase):
         from_attributes = True
 
 
+class IngredientSearchHit(IngredientRead):
+    score: float
+
+
 class CompoundIngredientIn(BaseModel):
     ingredient_id: Optional[int] = None
     ingredient_name: Optional[str] = None
@@ -37,6 +43,13 @@ class CompoundCreate(CompoundBase):
     items: List[CompoundIngredientIn]
 
 
+class CompoundItemsPatch(BaseModel):
+    # Lines to set (added if the ingredient is not in the formula yet)
+    upsert: List[CompoundIngredientIn] = []
+    # Ingredient ids whose lines are removed
+    remove: List[int] = []
+
+
 class CompoundRead(CompoundBase):
     id: int
     items: List[dict]
@@ -70,6 +83,52 @@ class AnalysisRead(BaseModel):
     prompt_text: str
     raw_response: str
     result_json: Optional[AnalysisResult]
+    pinned: bool = False
+    created_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class AnalysisPage(BaseModel):
+    # Rows carry only the requested fields (default: id, model, prompt_version, created_at, confidence)
+    items: List[dict]
+    # Pass back as ?cursor= for the next (older) page; None on the last page
+    next_cursor: Optional[str] = None
+
+class AnalysisBatchRequest(BaseModel):
+    compound_ids: Optional[List[int]] = None
+    name_contains: Optional[str] = None
+    concurrency: Optional[int] = Field(None, ge=1)
+    force: bool = False
+    mode: Optional[str] = Field(None, pattern="^(local|llm|hybrid)$")
+
+
+class AnalysisBatchItem(BaseModel):
+    compound_id: int
+    status: str  # ok|skipped|not_found|error
+    analysis_id: Optional[int] = None
+    job_id: Optional[int] = None  # LLM refinement job (hybrid mode)
+    detail: Optional[str] = None
+
+
+class AnalysisBatchResult(BaseModel):
+    total: int
+    succeeded: int
+    results: List[AnalysisBatchItem]
+
+
+class AnalysisJobRead(BaseModel):
+    id: int
+    compound_id: int
+    status: str  # queued|running|succeeded|failed
+    attempts: int
+    max_attempts: int
+    analysis_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -1,11 +1,43 @@
 from __future__ import annotations
+import asyncio
+import concurrent.futures
 import json
-from typing import Any, Dict, List, Tuple
+import os
+import threading
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple
 from pathlib import Path
 from dataclasses import dataclass
+from groq import BadRequestError
+from pydantic import BaseModel, ValidationError, create_model
+from pydantic_settings import BaseSettings
 from rapidfuzz import process, fuzz
 
-from ..services.groq_client import get_groq_client, get_groq_model_name
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..services.groq_client import get_async_groq_client, get_groq_client, get_groq_model_name, is_llm_configured
+from ..services import analysis_cache, local_engine
+from ..services.json_stream import TopLevelFieldParser, repair_json
+from .. import schemas
+
+
+class AnalysisSettings(BaseSettings):
+    # Upper bound on concurrent LLM calls for batch runs
+    analysis_batch_concurrency: int = int(os.getenv("ANALYSIS_BATCH_CONCURRENCY", "8"))
+    # Analysis rows written per commit during batch runs
+    analysis_batch_commit_size: int = int(os.getenv("ANALYSIS_BATCH_COMMIT_SIZE", "50"))
+    # Ask the provider for a JSON object response (response_format=json_object)
+    analysis_json_mode: bool = os.getenv("ANALYSIS_JSON_MODE", "true").lower() != "false"
+    # Default engine when a request does not pick one: local|llm|hybrid
+    analysis_mode: str = os.getenv("ANALYSIS_MODE", "llm")
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+settings = AnalysisSettings()
 
 
 @dataclass
@@ -40,6 +72,23 @@ def load_knowledge() -> List[KnowledgeItem]:
 
 _KNOWLEDGE = load_knowledge()
 _NAME_INDEX = [k.name for k in _KNOWLEDGE] + [a for k in _KNOWLEDGE for a in k.aliases]
+# Parallel to _NAME_INDEX: the item each name/alias belongs to
+_NAME_OWNERS = _KNOWLEDGE + [k for k in _KNOWLEDGE for _ in k.aliases]
+
+
+def _lookup_key(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+def _build_exact_index() -> Dict[str, KnowledgeItem]:
+    index: Dict[str, KnowledgeItem] = {}
+    # Iterate in _NAME_INDEX order so canonical names win over colliding aliases
+    for candidate, owner in zip(_NAME_INDEX, _NAME_OWNERS):
+        index.setdefault(_lookup_key(candidate), owner)
+    return index
+
+
+_EXACT_INDEX = _build_exact_index()
 
 
 def normalize_formula(items: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
@@ -47,21 +96,18 @@ def normalize_formula(items: List[Tuple[str, float]]) -> List[Tuple[str, float]]
     return [(name, round(p * 100.0 / total, 4)) for name, p in items]
 
 
+@lru_cache(maxsize=65536)
 def match_knowledge(name: str) -> KnowledgeItem | None:
-    # Fuzzy match against names and aliases
-    candidates = {}
-    for k in _KNOWLEDGE:
-        best = max(
-            [fuzz.WRatio(name, k.name)] + [fuzz.WRatio(name, alias) for alias in k.aliases],
-            default=0,
-        )
-        candidates[k.name] = best
-    best_name, score = max(candidates.items(), key=lambda x: x[1])
-    if score >= 85:
-        for k in _KNOWLEDGE:
-            if k.name == best_name:
-                return k
-    return None
+    # Exact (case/whitespace-insensitive) name or alias hit
+    exact = _EXACT_INDEX.get(_lookup_key(name))
+    if exact is not None:
+        return exact
+    # Fuzzy match against names and aliases in a single vectorized pass
+    match = process.extractOne(name, _NAME_INDEX, scorer=fuzz.WRatio, score_cutoff=85)
+    if match is None:
+        return None
+    _, _, idx = match
+    return _NAME_OWNERS[idx]
 
 
 def derive_features(normalized: List[Tuple[str, float]]):
@@ -118,6 +164,9 @@ JSON_SCHEMA = {
 }
 
 
+PROMPT_VERSION = "v1"
+
+
 SYSTEM_PROMPT = (
     "You are an expert perfumer and fragrance evaluator. Analyze the provided formula by olfactive families, note pyramid, accords, diffusion, and longevity."
     " Consider IFRA awareness in advisory tone only."
@@ -137,78 +186,425 @@ def build_user_prompt(normalized_items: List[Tuple[str, float]], derived: dict)
     return "\n".join(lines)
 
 
-def call_llm_with_retries(prompt_text: str, schema: dict, max_retries: int = 2) -> dict:
-    client = get_groq_client()
-    if client is None:
-        # Fallback if no API key
-        return {
-            "summary": "No LLM configured; returning heuristic-only advisory.",
-            "olfactive_family": [],
-            "top_notes": [],
-            "heart_notes": [],
-            "base_notes": [],
-            "accords": [],
-            "volatility_profile": {},
-            "projection": None,
-            "longevity_hours": None,
-            "similar_popular_scents": [],
-            "improvement_suggestions": [],
-            "safety_compliance": {"flags": ["advisory-only"], "notes": "Set GROQ_API_KEY to enable full analysis."},
-            "risks": [],
-            "confidence": 0.0,
-        }
-    model = get_groq_model_name()
-    messages = [
+NO_LLM_RESULT = {
+    "summary": "No LLM configured; returning heuristic-only advisory.",
+    "olfactive_family": [],
+    "top_notes": [],
+    "heart_notes": [],
+    "base_notes": [],
+    "accords": [],
+    "volatility_profile": {},
+    "projection": None,
+    "longevity_hours": None,
+    "similar_popular_scents": [],
+    "improvement_suggestions": [],
+    "safety_compliance": {"flags": ["advisory-only"], "notes": "Set GROQ_API_KEY to enable full analysis."},
+    "risks": [],
+    "confidence": 0.0,
+}
+
+
+FALLBACK_RESULT = {
+    "summary": "Preliminary analysis generated with limited certainty.",
+    "olfactive_family": [],
+    "top_notes": [],
+    "heart_notes": [],
+    "base_notes": [],
+    "accords": [],
+    "volatility_profile": {},
+    "projection": None,
+    "longevity_hours": None,
+    "similar_popular_scents": [],
+    "improvement_suggestions": [],
+    "safety_compliance": {"flags": ["advisory-only"], "notes": "Run formal IFRA checks."},
+    "risks": [],
+    "confidence": 0.2,
+}
+
+
+def _initial_messages(prompt_text: str, schema: dict) -> List[Dict[str, str]]:
+    return [
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": prompt_text},
-        {"role": "user", "content": f"JSON schema: {json.dumps(schema)}"},
+        {"role": "user", "content": f"JSON schema: {json.dumps(schema, separators=(',', ':'))}"},
     ]
-    last_text = ""
-    for attempt in range(max_retries + 1):
-        resp = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.2,
-            max_tokens=1200,
-        )
-        last_text = resp.choices[0].message.content or ""
-        # try to locate JSON in the output
-        start = last_text.find("{")
-        end = last_text.rfind("}")
-        if start != -1 and end != -1 and end > start:
-            maybe_json = last_text[start : end + 1]
-            try:
-                data = json.loads(maybe_json)
-                # minimally validate required keys
-                for k in schema.get("required", []):
-                    if k not in data:
-                        raise ValueError(f"Missing key {k}")
-                return data
-            except Exception:
-                messages.append({"role": "user", "content": "The previous response was not valid JSON per schema. Return valid JSON only."})
-                continue
-    # Fallback minimal result
-    return {
-        "summary": "Preliminary analysis generated with limited certainty.",
-        "olfactive_family": [],
-        "top_notes": [],
-        "heart_notes": [],
-        "base_notes": [],
-        "accords": [],
-        "volatility_profile": {},
-        "projection": None,
-        "longevity_hours": None,
-        "similar_popular_scents": [],
-        "improvement_suggestions": [],
-        "safety_compliance": {"flags": ["advisory-only"], "notes": "Run formal IFRA checks."},
-        "risks": [],
-        "confidence": 0.2,
+
+
+REPAIR_SYSTEM_PROMPT = "You repair JSON documents. Return only the corrected JSON object, with no commentary."
+
+
+def _repair_messages(text: str, problem: str, schema: dict) -> List[Dict[str, str]]:
+    # Send only the broken output and what is wrong with it, not the full analysis prompt
+    return [
+        {"role": "system", "content": REPAIR_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                f"Required keys: {', '.join(schema.get('required', []))}\n"
+                f"Problem: {problem}\n"
+                f"JSON to fix:\n{text}"
+            ),
+        },
+    ]
+
+
+@lru_cache(maxsize=8)
+def _compile_validator(schema_json: str) -> type[BaseModel]:
+    # AnalysisResult field types, with the schema's required keys made mandatory
+    required = set(json.loads(schema_json).get("required", []))
+    overrides = {
+        name: (field.annotation, ...)
+        for name, field in schemas.AnalysisResult.model_fields.items()
+        if name in required
     }
+    return create_model("RequiredAnalysisResult", __base__=schemas.AnalysisResult, **overrides)
+
+
+def _validator_for(schema: dict) -> type[BaseModel]:
+    return _compile_validator(json.dumps(schema, sort_keys=True))
+
+
+_RESULT_VALIDATOR = _validator_for(JSON_SCHEMA)
+
+
+def _parse_result(text: str, schema: dict) -> tuple[dict | None, str]:
+    """Return (validated result, "") or (None, description of the problem)"""
+    data = repair_json(text)
+    if not isinstance(data, dict):
+        return None, "no JSON object found" if data is None else "top-level value is not an object"
+    validator = _RESULT_VALIDATOR if schema is JSON_SCHEMA else _validator_for(schema)
+    try:
+        validator.model_validate(data)
+    except ValidationError as e:
+        problems = [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()[:10]]
+        return None, "; ".join(problems)
+    return data, ""
+
 
+def _completion_kwargs(model: str, messages: List[Dict[str, str]], json_mode: bool) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {"model": model, "messages": messages, "temperature": 0.2, "max_tokens": 1200}
+    if json_mode:
+        kwargs["response_format"] = {"type": "json_object"}
+    return kwargs
 
-def analyze_formula(formula: List[Tuple[str, float]]) -> tuple[str, str, dict]:
+
+def _failed_generation(error: BadRequestError) -> str | None:
+    """Groq reports JSON-mode validation failures as a 400 carrying the raw output"""
+    body = error.body if isinstance(error.body, dict) else {}
+    if isinstance(body.get("error"), dict):
+        body = body["error"]
+    return body.get("failed_generation")
+
+
+def _next_messages(initial: List[Dict[str, str]], text: str, problem: str, schema: dict) -> List[Dict[str, str]]:
+    # Nothing usable came back: regenerate; otherwise ask only for a repair
+    if not text.strip():
+        return initial
+    return _repair_messages(text, problem, schema)
+
+
+class _RetryLoop:
+    """
+    Decisions of the retry / repair / JSON-mode fallback loop, shared by the
+    async and blocking callers so only the transport call differs between them
+    """
+
+    def __init__(self, prompt_text: str, schema: dict, max_retries: int):
+        self.schema = schema
+        self.model = get_groq_model_name()
+        self.json_mode = settings.analysis_json_mode
+        self.initial = self.messages = _initial_messages(prompt_text, schema)
+        self.attempts_left = max_retries + 1
+
+    def next_request(self) -> Dict[str, Any] | None:
+        """Completion kwargs for the next attempt, or None once attempts are exhausted"""
+        if self.attempts_left <= 0:
+            return None
+        self.attempts_left -= 1
+        return _completion_kwargs(self.model, self.messages, self.json_mode)
+
+    def on_text(self, text: str) -> dict | None:
+        """Validated result, or None after preparing the follow-up request"""
+        data, problem = _parse_result(text, self.schema)
+        if data is None:
+            self.messages = _next_messages(self.initial, text, problem, self.schema)
+        return data
+
+    def on_bad_request(self, error: BadRequestError) -> dict | None:
+        if not self.json_mode:
+            raise error
+        text = _failed_generation(error)
+        if text is None:
+            # Model without JSON mode support: resend as plain text
+            self.json_mode = False
+            return None
+        return self.on_text(text)
+
+
+async def call_llm_with_retries(prompt_text: str, schema: dict, max_retries: int = 2) -> dict:
+    client = get_async_groq_client()
+    if client is None:
+        # Fallback if no API key
+        return dict(NO_LLM_RESULT)
+    loop = _RetryLoop(prompt_text, schema, max_retries)
+    while (kwargs := loop.next_request()) is not None:
+        try:
+            resp = await client.chat.completions.create(**kwargs)
+        except BadRequestError as e:
+            data = loop.on_bad_request(e)
+        else:
+            data = loop.on_text(resp.choices[0].message.content or "")
+        if data is not None:
+            return data
+    # Fallback minimal result
+    return dict(FALLBACK_RESULT)
+
+
+def call_llm_with_retries_sync(prompt_text: str, schema: dict, max_retries: int = 2) -> dict:
+    """Blocking variant of call_llm_with_retries for the Streamlit UI"""
+    client = get_groq_client()
+    if client is None:
+        return dict(NO_LLM_RESULT)
+    loop = _RetryLoop(prompt_text, schema, max_retries)
+    while (kwargs := loop.next_request()) is not None:
+        try:
+            resp = client.chat.completions.create(**kwargs)
+        except BadRequestError as e:
+            data = loop.on_bad_request(e)
+        else:
+            data = loop.on_text(resp.choices[0].message.content or "")
+        if data is not None:
+            return data
+    return dict(FALLBACK_RESULT)
+
+
+ANALYSIS_MODES = ("local", "llm", "hybrid")
+
+
+def resolve_mode(mode: str | None) -> str:
+    """Requested mode, else the configured default; always local when no LLM is configured"""
+    mode = mode or settings.analysis_mode
+    if mode not in ANALYSIS_MODES:
+        raise ValueError(f"Unknown analysis mode {mode!r}")
+    return mode if is_llm_configured() else "local"
+
+
+def result_provenance(mode: str) -> tuple[str, str]:
+    """(model, prompt_version) to record for a result produced in `mode`"""
+    if mode == "llm":
+        return get_groq_model_name(), PROMPT_VERSION
+    # hybrid responds with the local result first; the LLM refinement is recorded separately
+    return local_engine.LOCAL_MODEL_NAME, local_engine.LOCAL_ENGINE_VERSION
+
+
+def analyze_local(formula: List[Tuple[str, float]]) -> tuple[str, str, dict]:
+    """Rule-based analysis from the knowledge base; same return shape as analyze_formula"""
+    normalized = normalize_formula(formula)
+    lines = [(name, pct, match_knowledge(name)) for name, pct in normalized]
+    result = local_engine.analyze_lines(lines, derive_features(normalized))
+    return "", json.dumps(result, ensure_ascii=False), result
+
+
+def formula_cache_key(formula: List[Tuple[str, float]]) -> str:
+    return analysis_cache.make_cache_key(normalize_formula(formula), get_groq_model_name(), PROMPT_VERSION, JSON_SCHEMA)
+
+
+def _prepare(formula: List[Tuple[str, float]]) -> tuple[List[Tuple[str, float]], str, str]:
     normalized = normalize_formula(formula)
-    derived = derive_features(normalized)
-    user_prompt = build_user_prompt(normalized, derived)
-    result = call_llm_with_retries(user_prompt, JSON_SCHEMA)
-    return user_prompt, json.dumps(result, ensure_ascii=False), result
\ No newline at end of file
+    model = get_groq_model_name()
+    return normalized, model, analysis_cache.make_cache_key(normalized, model, PROMPT_VERSION, JSON_SCHEMA)
+
+
+def _cacheable(result: dict) -> bool:
+    # Never cache the stub results, so a later call can still reach the LLM
+    return result != NO_LLM_RESULT and result != FALLBACK_RESULT
+
+
+def _finish(db: Session | None, key: str, model: str, user_prompt: str, result: dict) -> tuple[str, str, dict]:
+    raw_response = json.dumps(result, ensure_ascii=False)
+    if db is not None and _cacheable(result):
+        analysis_cache.store(db, key, model, PROMPT_VERSION, user_prompt, raw_response, result)
+    return user_prompt, raw_response, result
+
+
+async def _run_cache(db: Session | AsyncSession, fn: Callable[..., Any], *args: Any) -> Any:
+    """Run a sync analysis_cache function on a Session or an AsyncSession"""
+    if not isinstance(db, AsyncSession):
+        return fn(db, *args)
+    # analyze_formulas shares one session between concurrent analyses; AsyncSession calls must not overlap
+    lock = db.info.setdefault("analysis_cache_lock", asyncio.Lock())
+    async with lock:
+        return await db.run_sync(fn, *args)
+
+
+async def _finish_async(db: Session | AsyncSession | None, key: str, model: str, user_prompt: str, result: dict) -> tuple[str, str, dict]:
+    output = _finish(None, key, model, user_prompt, result)
+    if db is not None and _cacheable(result):
+        await _run_cache(db, analysis_cache.store, key, model, PROMPT_VERSION, user_prompt, output[1], result)
+    return output
+
+
+# Single-flight registries: one LLM generation per cache key at a time.
+# Followers await the leader's result instead of issuing their own call.
+_INFLIGHT: Dict[str, asyncio.Future] = {}
+_INFLIGHT_SYNC: Dict[str, concurrent.futures.Future] = {}
+_INFLIGHT_SYNC_LOCK = threading.Lock()
+
+
+async def _join_inflight(key: str, generate: Callable[[], Awaitable[Any]]) -> tuple[bool, Any]:
+    future = _INFLIGHT.get(key)
+    leader = future is None
+    if leader:
+        future = asyncio.ensure_future(generate())
+        _INFLIGHT[key] = future
+        future.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    # Shield so one cancelled caller doesn't abort the call for everyone else
+    return leader, await asyncio.shield(future)
+
+
+def _join_inflight_sync(key: str, generate: Callable[[], Any]) -> tuple[bool, Any]:
+    with _INFLIGHT_SYNC_LOCK:
+        future = _INFLIGHT_SYNC.get(key)
+        leader = future is None
+        if leader:
+            future = concurrent.futures.Future()
+            _INFLIGHT_SYNC[key] = future
+    if not leader:
+        return False, future.result()
+    try:
+        value = generate()
+        future.set_result(value)
+        return True, value
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _INFLIGHT_SYNC_LOCK:
+            _INFLIGHT_SYNC.pop(key, None)
+
+
+async def analyze_formula_async(
+    formula: List[Tuple[str, float]], db: Session | AsyncSession | None = None, force: bool = False
+) -> tuple[str, str, dict]:
+    normalized, model, key = _prepare(formula)
+    if db is not None and not force:
+        cached = await _run_cache(db, analysis_cache.get_cached, key)
+        if cached is not None:
+            return cached.prompt_text, cached.raw_response, cached.result_json
+
+    async def _generate() -> tuple[str, dict]:
+        user_prompt = build_user_prompt(normalized, derive_features(normalized))
+        return user_prompt, await call_llm_with_retries(user_prompt, JSON_SCHEMA)
+
+    leader, (user_prompt, result) = await _join_inflight(key, _generate)
+    # Only the leader writes the cache entry
+    return await _finish_async(db if leader else None, key, model, user_prompt, result)
+
+
+def analyze_formula(formula: List[Tuple[str, float]], db: Session | None = None, force: bool = False) -> tuple[str, str, dict]:
+    normalized, model, key = _prepare(formula)
+    if db is not None and not force:
+        cached = analysis_cache.get_cached(db, key)
+        if cached is not None:
+            return cached.prompt_text, cached.raw_response, cached.result_json
+
+    def _generate() -> tuple[str, dict]:
+        user_prompt = build_user_prompt(normalized, derive_features(normalized))
+        return user_prompt, call_llm_with_retries_sync(user_prompt, JSON_SCHEMA)
+
+    leader, (user_prompt, result) = _join_inflight_sync(key, _generate)
+    return _finish(db if leader else None, key, model, user_prompt, result)
+
+
+async def stream_analysis(
+    formula: List[Tuple[str, float]], db: Session | AsyncSession | None = None, force: bool = False, mode: str = "llm"
+) -> AsyncIterator[tuple[str, Any]]:
+    """
+    Analyze a formula while streaming the LLM output
+
+    Yields:
+        ("local", rule-based result) first in hybrid mode, ("token", text delta),
+        ("field", (key, value)) for each top-level field as soon as it closes,
+        and finally ("result", analyze_formula output)
+    """
+    if mode != "llm":
+        _, _, local_result = output = analyze_local(formula)
+        if mode == "local":
+            for item in local_result.items():
+                yield "field", item
+            yield "result", output
+            return
+        yield "local", local_result
+
+    normalized, model, key = _prepare(formula)
+    if db is not None and not force:
+        cached = await _run_cache(db, analysis_cache.get_cached, key)
+        if cached is not None:
+            for item in (cached.result_json or {}).items():
+                yield "field", item
+            yield "result", (cached.prompt_text, cached.raw_response, cached.result_json)
+            return
+
+    user_prompt = build_user_prompt(normalized, derive_features(normalized))
+    client = get_async_groq_client()
+    if client is None:
+        result = dict(NO_LLM_RESULT)
+        for item in result.items():
+            yield "field", item
+        yield "result", await _finish_async(db, key, model, user_prompt, result)
+        return
+
+    parser = TopLevelFieldParser()
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=_initial_messages(user_prompt, JSON_SCHEMA),
+        temperature=0.2,
+        max_tokens=1200,
+        stream=True,
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        if not delta:
+            continue
+        yield "token", delta
+        for item in parser.feed(delta):
+            yield "field", item
+
+    result, _ = _parse_result(parser.buffer, JSON_SCHEMA)
+    if result is None:
+        # Streamed output was unusable; fall back to the retrying non-streaming path
+        result = await call_llm_with_retries(user_prompt, JSON_SCHEMA)
+    yield "result", await _finish_async(db, key, model, user_prompt, result)
+
+
+async def analyze_formulas(
+    formulas: Dict[int, List[Tuple[str, float]]],
+    concurrency: int,
+    db: Session | AsyncSession | None = None,
+    force: bool = False,
+) -> AsyncIterator[tuple[int, tuple[str, str, dict] | None, Exception | None]]:
+    """
+    Analyze many formulas with at most `concurrency` LLM calls in flight
+
+    Args:
+        formulas: Formula per caller-defined key (e.g. compound id)
+        concurrency: Maximum number of simultaneous analyses
+        db: Session used for the result cache only
+        force: Bypass the result cache
+
+    Yields:
+        (key, analyze_formula output or None, error or None) as each analysis completes
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _run(key: int, formula: List[Tuple[str, float]]):
+        async with semaphore:
+            try:
+                return key, await analyze_formula_async(formula, db=db, force=force), None
+            except Exception as e:
+                return key, None, e
+
+    for next_done in asyncio.as_completed([_run(k, f) for k, f in formulas.items()]):
+        yield await next_done
@@ -0,0 +1,110 @@
+"""Persistent analysis result cache keyed on the normalized formula"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+from pydantic_settings import BaseSettings
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app import models
+
+
+class AnalysisCacheSettings(BaseSettings):
+    analysis_cache_enabled: bool = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() != "false"
+    analysis_cache_ttl_seconds: int = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+_settings = AnalysisCacheSettings()
+
+
+def make_cache_key(normalized: List[Tuple[str, float]], model: str, prompt_version: str, schema: dict) -> str:
+    """
+    Content address for an analysis
+
+    Args:
+        normalized: Output of normalize_formula
+        model: LLM model name
+        prompt_version: Prompt version tag
+        schema: JSON schema the result must satisfy
+
+    Returns:
+        Hex sha256 digest
+    """
+    payload = json.dumps(
+        {
+            "formula": [[name, pct] for name, pct in normalized],
+            "model": model,
+            "prompt_version": prompt_version,
+            "schema": schema,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _is_fresh(entry: models.AnalysisCacheEntry) -> bool:
+    created_at = entry.created_at
+    if created_at is None:
+        return False
+    if created_at.tzinfo is None:
+        # SQLite hands back naive UTC timestamps
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    age = datetime.now(timezone.utc) - created_at
+    return age <= timedelta(seconds=_settings.analysis_cache_ttl_seconds)
+
+
+def get_cached(db: Session, key: str) -> models.AnalysisCacheEntry | None:
+    """Return the cache entry for key, or None if missing, expired or caching is disabled"""
+    if not _settings.analysis_cache_enabled:
+        return None
+    entry = db.get(models.AnalysisCacheEntry, key)
+    if entry is None or not _is_fresh(entry):
+        return None
+    return entry
+
+
+def store(db: Session, key: str, model: str, prompt_version: str, prompt_text: str, raw_response: str, result: dict) -> None:
+    """Insert or refresh a cache entry and commit"""
+    if not _settings.analysis_cache_enabled:
+        return
+    db.merge(
+        models.AnalysisCacheEntry(
+            key=key,
+            model=model,
+            prompt_version=prompt_version,
+            prompt_text=prompt_text,
+            raw_response=raw_response,
+            result_json=result,
+            created_at=datetime.now(timezone.utc),
+        )
+    )
+    db.commit()
+
+
+def invalidate(db: Session, key: str | None = None) -> int:
+    """
+    Drop cached analyses
+
+    Args:
+        db: Database session
+        key: Cache key to drop; all entries when None
+
+    Returns:
+        Number of entries removed
+    """
+    stmt = delete(models.AnalysisCacheEntry)
+    if key is not None:
+        stmt = stmt.where(models.AnalysisCacheEntry.key == key)
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount or 0
@@ -0,0 +1,290 @@
+"""Analysis row storage: content-addressed prompts and compressed raw responses"""
+from __future__ import annotations
+import hashlib
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.orm import Session, undefer
+
+from app import models
+
+_ZLIB_LEVEL = 6
+
+# Columns selectable in listings; the payload ones are only read when asked for
+FIELDS = ("id", "compound_id", "model", "prompt_version", "created_at", "pinned", "confidence", "prompt_text", "raw_response", "result_json")
+SUMMARY_FIELDS = ["id", "model", "prompt_version", "created_at", "confidence"]
+
+
+def prompt_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _insert_prompts_statement(dialect: str):
+    table = models.Prompt.__table__
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(table).on_conflict_do_nothing(index_elements=[table.c.hash])
+
+
+def intern_prompts(db: Session, texts: Iterable[str]) -> Dict[str, str]:
+    """
+    Store prompt texts once each (no commit)
+
+    Args:
+        db: Database session
+        texts: Prompt texts; empty ones (local analyses) are skipped
+
+    Returns:
+        Hash by text
+    """
+    hashes = {text: prompt_hash(text) for text in texts if text}
+    if not hashes:
+        return {}
+    rows = [{"hash": h, "text": text} for text, h in hashes.items()]
+    stmt = _insert_prompts_statement(db.get_bind().dialect.name)
+    if stmt is not None:
+        db.execute(stmt, rows)
+    else:
+        table = models.Prompt.__table__
+        known = set(db.execute(select(table.c.hash).where(table.c.hash.in_(list(hashes.values())))).scalars())
+        new_rows = [row for row in rows if row["hash"] not in known]
+        if new_rows:
+            db.execute(insert(table), new_rows)
+    return hashes
+
+
+def pack_raw(raw_response: str, result: dict | None) -> bytes | None:
+    """Compressed raw response, or None when it is just the serialized result"""
+    if not raw_response or raw_response == json.dumps(result, ensure_ascii=False):
+        return None
+    return zlib.compress(raw_response.encode("utf-8"), _ZLIB_LEVEL)
+
+
+def unpack_raw(raw_response_z: bytes | None, legacy_raw_response: str | None, result: dict | None) -> str:
+    if raw_response_z is not None:
+        return zlib.decompress(raw_response_z).decode("utf-8")
+    if legacy_raw_response:
+        return legacy_raw_response
+    return json.dumps(result, ensure_ascii=False)
+
+
+def add_analyses(db: Session, rows: List[Dict]) -> List[models.Analysis]:
+    """
+    Add Analysis rows in the compact storage format (no commit)
+
+    Prompts are interned with one statement, so call this right before
+    committing: on SQLite it opens the write transaction.
+
+    Args:
+        db: Database session
+        rows: Dicts with compound_id, model, prompt_version, prompt_text ("" for
+            local analyses), raw_response and result
+
+    Returns:
+        The pending Analysis objects, in input order
+    """
+    hashes = intern_prompts(db, [row["prompt_text"] for row in rows])
+    analyses = [
+        models.Analysis(
+            compound_id=row["compound_id"],
+            model=row["model"],
+            prompt_version=row["prompt_version"],
+            prompt_hash=hashes.get(row["prompt_text"]),
+            result_json=row["result"],
+            raw_response_z=pack_raw(row["raw_response"], row["result"]),
+        )
+        for row in rows
+    ]
+    db.add_all(analyses)
+    return analyses
+
+
+def add_analysis(
+    db: Session,
+    compound_id: int,
+    model: str,
+    prompt_version: str,
+    prompt_text: str,
+    raw_response: str,
+    result: dict | None,
+) -> models.Analysis:
+    """Add one Analysis row (no commit); see add_analyses"""
+    row = {
+        "compound_id": compound_id,
+        "model": model,
+        "prompt_version": prompt_version,
+        "prompt_text": prompt_text,
+        "raw_response": raw_response,
+        "result": result,
+    }
+    return add_analyses(db, [row])[0]
+
+
+def to_read(analysis: models.Analysis, prompt_text: str | None) -> Dict:
+    """AnalysisRead payload for a row loaded with its payload columns undeferred"""
+    return {
+        "id": analysis.id,
+        "compound_id": analysis.compound_id,
+        "model": analysis.model,
+        "prompt_version": analysis.prompt_version,
+        "prompt_text": prompt_text if prompt_text is not None else analysis.legacy_prompt_text or "",
+        "raw_response": unpack_raw(analysis.raw_response_z, analysis.legacy_raw_response, analysis.result_json),
+        "result_json": analysis.result_json,
+        "pinned": analysis.pinned,
+        "created_at": analysis.created_at,
+    }
+
+
+def to_record(analysis: models.Analysis, prompt_text: str | None) -> Dict:
+    """JSON-ready payload used by archives and library exports"""
+    record = to_read(analysis, prompt_text)
+    record["created_at"] = analysis.created_at.isoformat() if analysis.created_at else None
+    return record
+
+
+def rows_from_records(db: Session, records: List[Dict], keep_ids: bool = False, pin: bool = False) -> List[Dict]:
+    """
+    Analyses table rows for to_record payloads, interning their prompts (no commit)
+
+    Args:
+        db: Database session
+        records: Payloads whose compound_id already refers to this database
+        keep_ids: Reuse the records' ids (archive restore) instead of assigning new ones
+        pin: Pin every row
+
+    Returns:
+        Column dicts for one executemany insert into analyses
+    """
+    hashes = intern_prompts(db, [r["prompt_text"] for r in records])
+    rows = []
+    for r in records:
+        row = {
+            "compound_id": r["compound_id"],
+            "model": r["model"],
+            "prompt_version": r["prompt_version"],
+            "prompt_hash": hashes.get(r["prompt_text"]),
+            "result_json": r["result_json"],
+            "raw_response_z": pack_raw(r["raw_response"], r["result_json"]),
+            "prompt_text": "",
+            "raw_response": "",
+            "pinned": pin or bool(r.get("pinned")),
+            "created_at": datetime.fromisoformat(r["created_at"]) if r.get("created_at") else datetime.now(timezone.utc),
+        }
+        if keep_ids:
+            row["id"] = r["id"]
+        rows.append(row)
+    return rows
+
+
+def set_pinned(db: Session, analysis_id: int, pinned: bool) -> bool:
+    """Pin or unpin an analysis (commits); False if it doesn't exist"""
+    table = models.Analysis.__table__
+    found = db.execute(update(table).where(table.c.id == analysis_id).values(pinned=pinned)).rowcount > 0
+    db.commit()
+    return found
+
+
+def get_full(db: Session, analysis_id: int) -> Dict | None:
+    """Full payload of one analysis, or None if it doesn't exist"""
+    stmt = (
+        select(models.Analysis, models.Prompt.text)
+        .outerjoin(models.Prompt, models.Prompt.hash == models.Analysis.prompt_hash)
+        .where(models.Analysis.id == analysis_id)
+        .options(
+            undefer(models.Analysis.result_json),
+            undefer(models.Analysis.raw_response_z),
+            undefer(models.Analysis.legacy_prompt_text),
+            undefer(models.Analysis.legacy_raw_response),
+        )
+    )
+    row = db.execute(stmt).first()
+    return to_read(row[0], row[1]) if row else None
+
+
+def list_for_compound(db: Session, compound_id: int, fields: List[str], limit: int, before_id: int | None = None) -> List[Dict]:
+    """
+    Newest-first analyses of a compound, projected to the requested fields
+
+    Args:
+        db: Database session
+        compound_id: Compound ID
+        fields: Names from FIELDS
+        limit: Maximum rows
+        before_id: Only rows with a smaller id (keyset cursor)
+
+    Returns:
+        One dict per row with "id" plus the requested fields
+    """
+    a = models.Analysis
+    columns = {"id": a.id}
+    for name in fields:
+        if name in ("id", "compound_id", "model", "prompt_version", "created_at", "pinned", "result_json"):
+            columns[name] = getattr(a, name)
+        elif name == "confidence":
+            columns[name] = a.result_json["confidence"].as_float()
+        elif name == "prompt_text":
+            columns[name] = func.coalesce(models.Prompt.text, a.legacy_prompt_text)
+        elif name == "raw_response":
+            # Rebuilt in Python from whichever form the row is stored in
+            columns.update(_raw_z=a.raw_response_z, _raw_legacy=a.legacy_raw_response, _raw_result=a.result_json)
+
+    stmt = select(*(col.label(label) for label, col in columns.items())).where(a.compound_id == compound_id)
+    if "prompt_text" in fields:
+        stmt = stmt.outerjoin(models.Prompt, models.Prompt.hash == a.prompt_hash)
+    if before_id is not None:
+        stmt = stmt.where(a.id < before_id)
+    stmt = stmt.order_by(a.id.desc()).limit(limit)
+
+    rows = []
+    for row in db.execute(stmt).mappings():
+        item = {name: row[name] for name in ["id"] + fields if name in row}
+        if "raw_response" in fields:
+            item["raw_response"] = unpack_raw(row["_raw_z"], row["_raw_legacy"], row["_raw_result"])
+        rows.append(item)
+    return rows
+
+
+def compact_analyses(db: Session, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Move inline prompt/raw text of older rows into the compact format, committing per batch
+
+    Returns:
+        Counters: rows compacted, distinct prompts, raw responses kept (compressed)
+    """
+    a = models.Analysis
+    stats = {"rows": 0, "prompts": 0, "raw_compressed": 0}
+    seen_prompts: set[str] = set()
+    last_id = 0
+    while True:
+        batch = db.execute(
+            select(a.id, a.legacy_prompt_text, a.legacy_raw_response, a.result_json)
+            .where(a.id > last_id, (a.legacy_prompt_text != "") | (a.legacy_raw_response != ""))
+            .order_by(a.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            stats["prompts"] = len(seen_prompts)
+            return stats
+        hashes = intern_prompts(db, [row.legacy_prompt_text for row in batch])
+        updates = []
+        for row in batch:
+            raw_z = pack_raw(row.legacy_raw_response, row.result_json)
+            updates.append({"row_id": row.id, "hash": hashes.get(row.legacy_prompt_text), "raw_z": raw_z})
+            stats["raw_compressed"] += raw_z is not None
+        db.execute(
+            update(a.__table__)
+            .where(a.__table__.c.id == bindparam("row_id"))
+            .values(prompt_hash=bindparam("hash"), raw_response_z=bindparam("raw_z"), prompt_text="", raw_response=""),
+            updates,
+        )
+        db.commit()
+        stats["rows"] += len(batch)
+        seen_prompts.update(hashes.values())
+        last_id = batch[-1].id
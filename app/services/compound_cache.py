@@ -0,0 +1,94 @@
+"""In-process read-through cache of serialized compounds, with content ETags"""
+from __future__ import annotations
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict
+
+import orjson
+from pydantic_settings import BaseSettings
+
+
+class CompoundCacheSettings(BaseSettings):
+    # Compounds kept per process (least recently used evicted); 0 disables the cache
+    compound_cache_size: int = int(os.getenv("COMPOUND_CACHE_SIZE", "1024"))
+    # Bounds staleness from writes made by other processes, which can't invalidate this one
+    compound_cache_ttl_seconds: float = float(os.getenv("COMPOUND_CACHE_TTL_SECONDS", "60"))
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+settings = CompoundCacheSettings()
+
+
+@dataclass(frozen=True)
+class CachedCompound:
+    data: Dict  # CompoundRead payload; treat as read-only
+    body: bytes  # JSON encoding of data
+    etag: str  # strong validator: hash of body, stable across restarts and processes
+
+
+_lock = threading.Lock()
+_entries: OrderedDict[int, tuple[float, CachedCompound]] = OrderedDict()
+# Bumped on every write; a load that raced a write is not stored
+_versions: Dict[int, int] = {}
+
+
+def version(compound_id: int) -> int:
+    with _lock:
+        return _versions.get(compound_id, 0)
+
+
+def get(compound_id: int) -> CachedCompound | None:
+    with _lock:
+        entry = _entries.get(compound_id)
+        if entry is None:
+            return None
+        expires_at, cached = entry
+        if expires_at < time.monotonic():
+            del _entries[compound_id]
+            return None
+        _entries.move_to_end(compound_id)
+        return cached
+
+
+def put(compound_id: int, loaded_version: int, data: Dict) -> CachedCompound:
+    """Serialize data and cache it, unless the compound changed since loaded_version was read"""
+    body = orjson.dumps(data)
+    cached = CachedCompound(data=data, body=body, etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+    if settings.compound_cache_size <= 0:
+        return cached
+    with _lock:
+        if _versions.get(compound_id, 0) == loaded_version:
+            _entries[compound_id] = (time.monotonic() + settings.compound_cache_ttl_seconds, cached)
+            _entries.move_to_end(compound_id)
+            while len(_entries) > settings.compound_cache_size:
+                _entries.popitem(last=False)
+    return cached
+
+
+def invalidate(compound_id: int) -> None:
+    """Call after a compound's name, description or formula changed, or it was deleted"""
+    with _lock:
+        _versions[compound_id] = _versions.get(compound_id, 0) + 1
+        _entries.pop(compound_id, None)
+
+
+def clear() -> None:
+    with _lock:
+        for compound_id in _entries:
+            _versions[compound_id] = _versions.get(compound_id, 0) + 1
+        _entries.clear()
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match evaluation (weak comparison, as RFC 9110 specifies for this header)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
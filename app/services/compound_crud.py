@@ -1,7 +1,10 @@
 """Simple CRUD operations for compounds - MVP version"""
+from datetime import datetime
+from sqlalchemy import and_, bindparam, delete, func, insert, or_, select, update
 from sqlalchemy.orm import Session
 from app import models
-from typing import List, Dict
+from app.services import compound_cache, ingredient_crud
+from typing import List, Dict, Optional, Tuple
 
 
 def create_compound(db: Session, name: str, description: str, ingredients: List[Dict]) -> int:
@@ -21,79 +24,229 @@ def create_compound(db: Session, name: str, description: str, ingredients: List[
     db.add(compound)
     db.flush()
 
-    for ing in ingredients:
-        # Get or create ingredient by name
-        ingredient = db.query(models.Ingredient).filter(
-            models.Ingredient.name == ing["name"]
-        ).first()
-
-        if not ingredient:
-            ingredient = models.Ingredient(name=ing["name"])
-            db.add(ingredient)
-            db.flush()
-
-        ci = models.CompoundIngredient(
-            compound_id=compound.id,
-            ingredient_id=ingredient.id,
-            percentage=ing["percentage"]
-        )
-        db.add(ci)
+    _, by_key = ingredient_crud.resolve_ingredients(db, [], [ing["name"] for ing in ingredients])
+    add_items(
+        db,
+        compound.id,
+        [(by_key[models.normalize_name(ing["name"])][0], ing["percentage"]) for ing in ingredients],
+    )
 
     db.commit()
     return compound.id
 
 
-def get_all_compounds(db: Session, search: str = "") -> List[Dict]:
+def add_items(db: Session, compound_id: int, items: List[Tuple[int, float]]) -> None:
+    """
+    Insert a compound's formula lines in one statement (no commit)
+
+    Args:
+        db: Database session
+        compound_id: Compound ID
+        items: (ingredient_id, percentage) pairs
+    """
+    if items:
+        db.execute(
+            insert(models.CompoundIngredient),
+            [{"compound_id": compound_id, "ingredient_id": ingredient_id, "percentage": pct} for ingredient_id, pct in items],
+        )
+
+
+def sync_items(db: Session, compound_id: int, items: List[Tuple[int, float]]) -> bool:
+    """
+    Make a compound's formula lines match items with minimal writes (no commit)
+
+    Existing lines are paired with desired ones by ingredient; only changed
+    percentages are updated, unmatched desired lines inserted and leftovers deleted.
+
+    Args:
+        db: Database session
+        compound_id: Compound ID
+        items: Desired (ingredient_id, percentage) pairs
+
+    Returns:
+        True if any line was written
+    """
+    table = models.CompoundIngredient.__table__
+    existing: Dict[int, List[Tuple[int, float]]] = {}
+    for row in db.execute(
+        select(table.c.id, table.c.ingredient_id, table.c.percentage).where(table.c.compound_id == compound_id).order_by(table.c.id)
+    ):
+        existing.setdefault(row.ingredient_id, []).append((row.id, row.percentage))
+
+    changed: List[Dict] = []
+    added: List[Tuple[int, float]] = []
+    for ingredient_id, pct in items:
+        lines = existing.get(ingredient_id)
+        if lines:
+            line_id, current = lines.pop(0)
+            if current != pct:
+                changed.append({"line_id": line_id, "pct": pct})
+        else:
+            added.append((ingredient_id, pct))
+    removed = [line_id for lines in existing.values() for line_id, _ in lines]
+
+    if changed:
+        db.execute(
+            update(table).where(table.c.id == bindparam("line_id")).values(percentage=bindparam("pct")),
+            changed,
+        )
+    if removed:
+        db.execute(delete(table).where(table.c.id.in_(removed)))
+    add_items(db, compound_id, added)
+    return bool(changed or added or removed)
+
+
+def patch_items(db: Session, compound_id: int, upserts: List[Tuple[int, float]], remove: List[int]) -> bool:
     """
-    Get all compounds with optional search
+    Edit individual formula lines (no commit)
+
+    Args:
+        db: Database session
+        compound_id: Compound ID
+        upserts: (ingredient_id, percentage) to set, adding the line if absent
+        remove: Ingredient ids whose lines are deleted
+
+    Returns:
+        True if any line was written
+    """
+    table = models.CompoundIngredient.__table__
+    current = {
+        row.ingredient_id: (row.id, row.percentage)
+        for row in db.execute(select(table.c.id, table.c.ingredient_id, table.c.percentage).where(table.c.compound_id == compound_id))
+    }
+    changed = [{"line_id": current[i][0], "pct": pct} for i, pct in upserts if i in current and current[i][1] != pct]
+    added = [(i, pct) for i, pct in dict(upserts).items() if i not in current]
+    removed = [i for i in remove if i in current]
+
+    if changed:
+        db.execute(
+            update(table).where(table.c.id == bindparam("line_id")).values(percentage=bindparam("pct")),
+            changed,
+        )
+    if removed:
+        db.execute(delete(table).where(table.c.compound_id == compound_id, table.c.ingredient_id.in_(removed)))
+    add_items(db, compound_id, added)
+    return bool(changed or added or removed)
+
+
+def get_items(db: Session, compound_id: int) -> List[Dict]:
+    """Formula lines with ingredient names, in one joined query"""
+    stmt = (
+        select(models.CompoundIngredient.ingredient_id, models.Ingredient.name, models.CompoundIngredient.percentage)
+        .join(models.Ingredient, models.Ingredient.id == models.CompoundIngredient.ingredient_id)
+        .where(models.CompoundIngredient.compound_id == compound_id)
+        .order_by(models.CompoundIngredient.id)
+    )
+    return [
+        {"ingredient_id": row.ingredient_id, "ingredient_name": row.name, "percentage": row.percentage}
+        for row in db.execute(stmt)
+    ]
+
+
+def get_all_compounds(
+    db: Session,
+    search: str = "",
+    limit: Optional[int] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+) -> List[Dict]:
+    """
+    Get compound summaries, newest first, in a single aggregate query
 
     Args:
         db: Database session
         search: Optional search query (filters by name)
+        limit: Optional page size
+        after: Keyset cursor (updated_at, id) of the last row of the previous page
 
     Returns:
         List of compound summaries
     """
-    query = db.query(models.Compound)
+    ingredient_count = func.count(models.CompoundIngredient.id).label("ingredient_count")
+    updated_at = models.Compound.updated_at
+    if db.get_bind().dialect.name == "sqlite":
+        # Stored text may or may not carry fractional seconds; compare both sides at one precision
+        updated_at = func.datetime(updated_at)
+    stmt = (
+        select(
+            models.Compound.id,
+            models.Compound.name,
+            models.Compound.description,
+            models.Compound.updated_at,
+            ingredient_count,
+        )
+        .outerjoin(models.CompoundIngredient, models.CompoundIngredient.compound_id == models.Compound.id)
+        .group_by(models.Compound.id)
+        .order_by(updated_at.desc(), models.Compound.id.desc())
+    )
     if search:
-        query = query.filter(models.Compound.name.ilike(f"%{search}%"))
+        stmt = stmt.where(models.Compound.name.ilike(f"%{search}%"))
+    if after is not None:
+        after_updated_at, after_id = after
+        if db.get_bind().dialect.name == "sqlite":
+            after_updated_at = func.datetime(after_updated_at)
+        stmt = stmt.where(
+            or_(
+                updated_at < after_updated_at,
+                and_(updated_at == after_updated_at, models.Compound.id < after_id),
+            )
+        )
+    if limit is not None:
+        stmt = stmt.limit(limit)
 
-    compounds = query.order_by(models.Compound.updated_at.desc()).all()
     return [
         {
-            "id": c.id,
-            "name": c.name,
-            "description": c.description or "",
-            "ingredient_count": len(c.ingredients),
-            "updated_at": c.updated_at
+            "id": row.id,
+            "name": row.name,
+            "description": row.description or "",
+            "ingredient_count": row.ingredient_count,
+            "updated_at": row.updated_at
         }
-        for c in compounds
+        for row in db.execute(stmt)
     ]
 
 
-def get_compound(db: Session, compound_id: int) -> Dict:
+def load_compound(db: Session, compound_id: int) -> Optional[compound_cache.CachedCompound]:
     """
-    Get compound with full ingredient details
+    Compound with its formula lines, served from the in-process cache when present
 
     Args:
         db: Database session
         compound_id: Compound ID
 
     Returns:
-        Full compound data with ingredients or None
+        CachedCompound (CompoundRead payload, JSON body and ETag) or None
     """
+    cached = compound_cache.get(compound_id)
+    if cached is not None:
+        return cached
+    loaded_version = compound_cache.version(compound_id)
     compound = db.get(models.Compound, compound_id)
     if not compound:
         return None
+    data = {"id": compound.id, "name": compound.name, "description": compound.description, "items": get_items(db, compound.id)}
+    return compound_cache.put(compound_id, loaded_version, data)
+
+
+def get_compound(db: Session, compound_id: int) -> Dict:
+    """
+    Get compound with full ingredient details
+
+    Args:
+        db: Database session
+        compound_id: Compound ID
 
+    Returns:
+        Full compound data with ingredients or None
+    """
+    cached = load_compound(db, compound_id)
+    if cached is None:
+        return None
+    data = cached.data
     return {
-        "id": compound.id,
-        "name": compound.name,
-        "description": compound.description or "",
-        "ingredients": [
-            {"name": ci.ingredient.name, "percentage": ci.percentage}
-            for ci in compound.ingredients
-        ]
+        "id": data["id"],
+        "name": data["name"],
+        "description": data["description"] or "",
+        "ingredients": [{"name": item["ingredient_name"], "percentage": item["percentage"]} for item in data["items"]],
     }
 
 
@@ -109,3 +262,4 @@ def delete_compound(db: Session, compound_id: int):
     if compound:
         db.delete(compound)
         db.commit()
+    compound_cache.invalidate(compound_id)
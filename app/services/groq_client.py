@@ -1,12 +1,21 @@
 from __future__ import annotations
 import os
+import threading
+import httpx
 from pydantic_settings import BaseSettings
-from groq import Groq
+from groq import AsyncGroq, DefaultAsyncHttpxClient, DefaultHttpxClient, Groq
 
 
 class GroqSettings(BaseSettings):
     groq_api_key: str | None = os.getenv("GROQ_API_KEY")
     groq_model: str = os.getenv("GROQ_MODEL", "llama-3.1-70b-versatile")
+    # Point at a compatible server (e.g. python -m app.fake_groq) instead of api.groq.com
+    groq_base_url: str | None = os.getenv("GROQ_BASE_URL")
+    # Shared connection pool sizing for the process-wide clients
+    groq_max_connections: int = int(os.getenv("GROQ_MAX_CONNECTIONS", "200"))
+    groq_max_keepalive_connections: int = int(os.getenv("GROQ_MAX_KEEPALIVE_CONNECTIONS", "50"))
+    groq_keepalive_expiry: float = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", "30"))
+    groq_timeout: float = float(os.getenv("GROQ_TIMEOUT", "60"))
 
     class Config:
         env_file = ".env"
@@ -15,12 +24,65 @@ class GroqSettings(BaseSettings):
 
 _settings = GroqSettings()
 
+_client: Groq | None = None
+_async_client: AsyncGroq | None = None
+_lock = threading.Lock()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_settings.groq_max_connections,
+        max_keepalive_connections=_settings.groq_max_keepalive_connections,
+        keepalive_expiry=_settings.groq_keepalive_expiry,
+    )
+
 
 def get_groq_client() -> Groq | None:
+    """Process-wide sync client; reuses one HTTP connection pool across calls"""
+    global _client
     if not _settings.groq_api_key:
         return None
-    return Groq(api_key=_settings.groq_api_key)
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = Groq(
+                    api_key=_settings.groq_api_key,
+                    base_url=_settings.groq_base_url,
+                    timeout=_settings.groq_timeout,
+                    http_client=DefaultHttpxClient(limits=_limits(), timeout=_settings.groq_timeout),
+                )
+    return _client
+
+
+def get_async_groq_client() -> AsyncGroq | None:
+    """Process-wide async client; must be used from the event loop that serves the app"""
+    global _async_client
+    if not _settings.groq_api_key:
+        return None
+    if _async_client is None:
+        _async_client = AsyncGroq(
+            api_key=_settings.groq_api_key,
+            base_url=_settings.groq_base_url,
+            timeout=_settings.groq_timeout,
+            http_client=DefaultAsyncHttpxClient(limits=_limits(), timeout=_settings.groq_timeout),
+        )
+    return _async_client
+
+
+async def close_groq_clients() -> None:
+    """Release pooled connections (call on application shutdown)"""
+    global _client, _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def is_llm_configured() -> bool:
+    return bool(_settings.groq_api_key)
 
 
 def get_groq_model_name() -> str:
-    return _settings.groq_model
\ No newline at end of file
+    return _settings.groq_model
@@ -0,0 +1,226 @@
+"""Set-based ingredient writes"""
+from __future__ import annotations
+import os
+from typing import Dict, Iterable, List
+
+from pydantic_settings import BaseSettings
+from sqlalchemy import func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+
+
+class IngredientSettings(BaseSettings):
+    # Rows resolved/upserted per statement and committed per transaction
+    ingredient_upsert_chunk_size: int = int(os.getenv("INGREDIENT_UPSERT_CHUNK_SIZE", "1000"))
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+settings = IngredientSettings()
+
+_UPDATABLE = ("cas_number", "tags", "aliases", "volatility_class", "default_odour_notes")
+
+
+def to_row(item: schemas.IngredientCreate) -> Dict:
+    """Column values for an ingredient payload; empty values become None so they never overwrite"""
+    name = item.name.strip()
+    return {
+        "name": name,
+        "normalized_name": models.normalize_name(name),
+        "cas_number": item.cas_number or None,
+        "tags": ",".join(item.tags) if item.tags else None,
+        "aliases": ",".join(item.aliases) if item.aliases else None,
+        "volatility_class": item.volatility_class or None,
+        "default_odour_notes": item.default_odour_notes or None,
+    }
+
+
+def _dedupe(rows: Iterable[Dict]) -> Dict[str, Dict]:
+    # One row per normalized name; later non-empty fields win, as sequential upserts would
+    merged: Dict[str, Dict] = {}
+    for row in rows:
+        existing = merged.get(row["normalized_name"])
+        if existing is None:
+            merged[row["normalized_name"]] = dict(row)
+        else:
+            existing.update({k: v for k, v in row.items() if k in _UPDATABLE and v is not None})
+    return merged
+
+
+def _insert_ignore_statement(dialect: str):
+    table = models.Ingredient.__table__
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing(index_elements=[table.c.normalized_name])
+
+
+def _upsert_statement(dialect: str):
+    table = models.Ingredient.__table__
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    stmt = dialect_insert(table)
+    merged = {col: func.coalesce(stmt.excluded[col], table.c[col]) for col in _UPDATABLE}
+    # Unchanged rows are left alone: no write, no FTS trigger, not counted as updated
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.normalized_name],
+        set_=merged,
+        where=or_(*(value.is_distinct_from(table.c[col]) for col, value in merged.items())),
+    )
+
+
+def _changes(row: Dict, current) -> Dict:
+    return {col: row[col] for col in _UPDATABLE if row[col] is not None and row[col] != getattr(current, col)}
+
+
+def upsert_rows(db: Session, rows: Iterable[Dict]) -> tuple[Dict[str, int], int, int]:
+    """
+    Insert or update one chunk of ingredient rows (no commit)
+
+    Args:
+        db: Database session
+        rows: Dicts from to_row
+
+    Returns:
+        (ingredient id by normalized name, rows inserted, existing rows whose values changed)
+    """
+    merged = _dedupe(rows)
+    if not merged:
+        return {}, 0, 0
+    table = models.Ingredient.__table__
+    keys = list(merged)
+    current = {
+        row.normalized_name: row
+        for row in db.execute(
+            select(table.c.normalized_name, table.c.id, *(table.c[col] for col in _UPDATABLE)).where(table.c.normalized_name.in_(keys))
+        )
+    }
+    changes = {key: _changes(merged[key], row) for key, row in current.items()}
+    changes = {key: values for key, values in changes.items() if values}
+
+    upsert = _upsert_statement(db.get_bind().dialect.name)
+    if upsert is not None:
+        db.execute(upsert, list(merged.values()))
+    else:
+        new_rows = [row for key, row in merged.items() if key not in current]
+        if new_rows:
+            db.execute(insert(table), new_rows)
+        for key, values in changes.items():
+            db.execute(table.update().where(table.c.normalized_name == key).values(values))
+
+    new_keys = [key for key in keys if key not in current]
+    ids = {key: row.id for key, row in current.items()}
+    if new_keys:
+        ids.update(db.execute(select(table.c.normalized_name, table.c.id).where(table.c.normalized_name.in_(new_keys))).all())
+    return ids, len(new_keys), len(changes)
+
+
+def bulk_upsert(db: Session, items: Iterable[schemas.IngredientCreate], chunk_size: int | None = None) -> Dict[str, int]:
+    """
+    Upsert ingredients in chunks, committing after each chunk
+
+    Returns:
+        Counters: received, inserted, updated, chunks
+    """
+    chunk_size = chunk_size or settings.ingredient_upsert_chunk_size
+    stats = {"received": 0, "inserted": 0, "updated": 0, "chunks": 0}
+    chunk: List[Dict] = []
+
+    def _flush() -> None:
+        _, inserted, updated = upsert_rows(db, chunk)
+        db.commit()
+        stats["inserted"] += inserted
+        stats["updated"] += updated
+        stats["chunks"] += 1
+        chunk.clear()
+
+    for item in items:
+        chunk.append(to_row(item))
+        stats["received"] += 1
+        if len(chunk) >= chunk_size:
+            _flush()
+    if chunk:
+        _flush()
+    return stats
+
+
+def get_by_normalized_names(db: Session, keys: List[str], chunk_size: int | None = None) -> Dict[str, models.Ingredient]:
+    """Ingredients by normalized name, one IN query per chunk"""
+    chunk_size = chunk_size or settings.ingredient_upsert_chunk_size
+    found: Dict[str, models.Ingredient] = {}
+    unique_keys = list(dict.fromkeys(keys))
+    for start in range(0, len(unique_keys), chunk_size):
+        batch = unique_keys[start : start + chunk_size]
+        for ingredient in db.execute(select(models.Ingredient).where(models.Ingredient.normalized_name.in_(batch))).scalars():
+            found[ingredient.normalized_name] = ingredient
+    return found
+
+
+def resolve_ingredients(
+    db: Session, ids: Iterable[int], names: Iterable[str]
+) -> tuple[Dict[int, str], Dict[str, tuple[int, str]]]:
+    """
+    Resolve a formula's ingredient references, creating unknown names (no commit)
+
+    Known ids and names are fetched in one query; missing names are inserted in
+    one statement that ignores rows a concurrent writer created first, then read back.
+
+    Args:
+        db: Database session
+        ids: Ingredient ids referenced by the formula
+        names: Ingredient names referenced by the formula
+
+    Returns:
+        (name by id for the ids that exist, (id, name) by normalized name)
+    """
+    table = models.Ingredient.__table__
+    id_list = list(dict.fromkeys(ids))
+    wanted = {models.normalize_name(name): name.strip() for name in names}
+    if not id_list and not wanted:
+        return {}, {}
+
+    by_id: Dict[int, str] = {}
+    by_key: Dict[str, tuple[int, str]] = {}
+    conditions = []
+    if id_list:
+        conditions.append(table.c.id.in_(id_list))
+    if wanted:
+        conditions.append(table.c.normalized_name.in_(list(wanted)))
+    for row in db.execute(select(table.c.id, table.c.name, table.c.normalized_name).where(or_(*conditions))):
+        if row.id in id_list:
+            by_id[row.id] = row.name
+        if row.normalized_name in wanted:
+            by_key[row.normalized_name] = (row.id, row.name)
+
+    missing = [key for key in wanted if key not in by_key]
+    if missing:
+        db.execute(
+            _insert_ignore_statement(db.get_bind().dialect.name),
+            [{"name": wanted[key], "normalized_name": key} for key in missing],
+        )
+        for row in db.execute(select(table.c.id, table.c.name, table.c.normalized_name).where(table.c.normalized_name.in_(missing))):
+            by_key[row.normalized_name] = (row.id, row.name)
+    return by_id, by_key
+
+
+def to_read(ingredient) -> Dict:
+    """IngredientRead payload; tags and aliases are stored comma-separated"""
+    return {
+        "id": ingredient.id,
+        "name": ingredient.name,
+        "cas_number": ingredient.cas_number,
+        "tags": ingredient.tags.split(",") if ingredient.tags else None,
+        "aliases": ingredient.aliases.split(",") if ingredient.aliases else None,
+        "volatility_class": ingredient.volatility_class,
+        "default_odour_notes": ingredient.default_odour_notes,
+    }
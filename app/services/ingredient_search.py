@@ -0,0 +1,126 @@
+"""Ingredient typeahead: FTS5 trigram candidates re-ranked with rapidfuzz"""
+from __future__ import annotations
+import os
+from typing import Dict, List
+
+from pydantic_settings import BaseSettings
+from rapidfuzz import fuzz, utils
+from sqlalchemy import or_, select, text
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services.ingredient_crud import to_read
+
+
+class IngredientSearchSettings(BaseSettings):
+    # Candidates fetched from the index before fuzzy re-scoring
+    ingredient_search_candidates: int = int(os.getenv("INGREDIENT_SEARCH_CANDIDATES", "100"))
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+settings = IngredientSearchSettings()
+
+_FTS_TABLE = "ingredients_fts"
+_fts_available: Dict[str, bool] = {}
+# Hits below this are noise (shared trigrams only)
+_MIN_SCORE = 50.0
+
+
+def _has_fts(db: Session) -> bool:
+    bind = db.get_bind()
+    url = str(bind.url)
+    if url not in _fts_available:
+        _fts_available[url] = bind.dialect.name == "sqlite" and db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": _FTS_TABLE}
+        ).first() is not None
+    return _fts_available[url]
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _fts_ids(db: Session, match: str, k: int) -> List[int]:
+    # Unranked: bm25 over a common trigram's match set costs tens of ms, rapidfuzz ranks instead
+    stmt = text(f"SELECT rowid FROM {_FTS_TABLE} WHERE {_FTS_TABLE} MATCH :match LIMIT :k")
+    return db.execute(stmt, {"match": match, "k": k}).scalars().all()
+
+
+def _candidate_ids(db: Session, query: str, k: int) -> List[int]:
+    key = models.normalize_name(query)
+    table = models.Ingredient.__table__
+    # Name prefix range scan on the unique index: cheap and the most likely typeahead hits
+    prefix = (table.c.normalized_name >= key) & (table.c.normalized_name < key + "\uffff")
+    ids = dict.fromkeys(db.execute(select(table.c.id).where(prefix).order_by(table.c.normalized_name).limit(k)).scalars())
+    if len(key) < 3:
+        return list(ids)
+
+    if not _has_fts(db):
+        like = f"%{query.strip()}%"
+        cond = or_(table.c.name.ilike(like), table.c.aliases.ilike(like), table.c.tags.ilike(like), table.c.cas_number.ilike(like))
+        ids.update(dict.fromkeys(db.execute(select(table.c.id).where(cond).limit(k)).scalars()))
+        return list(ids)
+
+    # Substring hits anywhere in name, aliases, tags or CAS
+    ids.update(dict.fromkeys(_fts_ids(db, _quote(key), k)))
+    if len(ids) < k:
+        # Typo tolerance: rows containing either half of the query, or any of its trigrams if short
+        if len(key) >= 6:
+            terms = [key[: len(key) // 2], key[len(key) // 2 :]]
+        else:
+            terms = [key[i : i + 3] for i in range(len(key) - 2)]
+        ids.update(dict.fromkeys(_fts_ids(db, " OR ".join(_quote(t) for t in dict.fromkeys(terms)), k)))
+    return list(ids)
+
+
+def _words(values: List[str]) -> List[str]:
+    return [word for value in values for word in models.normalize_name(value.replace("-", " ")).split()]
+
+
+def _prefix_score(key: str, words: List[str], low: float, high: float) -> float:
+    # A typed prefix of any word scores from low (barely started) to high (whole word)
+    coverage = max((len(key) / len(word) for word in words if word.startswith(key)), default=0.0)
+    return low + (high - low) * coverage if coverage else 0.0
+
+
+def _score(query: str, ingredient) -> float:
+    names = [ingredient.name] + (ingredient.aliases.split(",") if ingredient.aliases else [])
+    tags = ingredient.tags.split(",") if ingredient.tags else []
+    score = max(fuzz.WRatio(query, name, processor=utils.default_process) for name in names)
+    key = models.normalize_name(query)
+    if any(models.normalize_name(name).startswith(key) for name in names):
+        score = min(100.0, score + 5)
+    if ingredient.cas_number and ingredient.cas_number.strip() == query.strip():
+        return 100.0
+    if key in (models.normalize_name(tag) for tag in tags):
+        score = max(score, 70.0)
+    elif key and " " not in key:
+        # Fuzzy ratios underrate partial words ("woo" vs "woody"); tag hits rank below name hits
+        score = max(score, _prefix_score(key, _words(names), 75.0, 95.0), _prefix_score(key, _words(tags), 55.0, 70.0))
+    return round(score, 1)
+
+
+def search_ingredients(db: Session, query: str, limit: int = 10) -> List[Dict]:
+    """
+    Ranked typeahead over ingredient names, aliases, tags and CAS numbers
+
+    Args:
+        db: Database session
+        query: Partial text as typed
+        limit: Maximum hits returned
+
+    Returns:
+        IngredientRead payloads with a "score" (0-100), best first
+    """
+    if not query.strip():
+        return []
+    ids = _candidate_ids(db, query, max(limit, settings.ingredient_search_candidates))
+    if not ids:
+        return []
+    table = models.Ingredient.__table__
+    rows = db.execute(select(table).where(table.c.id.in_(ids))).all()
+    ranked = sorted(((_score(query, row), row) for row in rows), key=lambda x: (-x[0], len(x[1].name), x[1].name))
+    return [dict(to_read(row), score=score) for score, row in ranked[:limit] if score >= _MIN_SCORE]
@@ -0,0 +1,161 @@
+"""DB-backed analysis job queue shared by the API and app.worker processes"""
+from __future__ import annotations
+import os
+from datetime import datetime, timedelta, timezone
+
+from pydantic_settings import BaseSettings
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from app import models
+
+
+class JobSettings(BaseSettings):
+    job_max_attempts: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    # A running job whose lock is older than this is handed to another worker
+    job_visibility_timeout_seconds: int = int(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "300"))
+    job_retry_backoff_seconds: int = int(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "10"))
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+settings = JobSettings()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue_analysis(db: Session, compound_id: int, force: bool = False) -> models.AnalysisJob:
+    """
+    Queue an analysis for a worker to pick up
+
+    Args:
+        db: Database session
+        compound_id: Compound to analyze
+        force: Bypass the analysis result cache
+
+    Returns:
+        The committed job
+    """
+    job = models.AnalysisJob(
+        compound_id=compound_id,
+        status="queued",
+        force=force,
+        attempts=0,
+        max_attempts=settings.job_max_attempts,
+        available_at=_now(),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def enqueue_analyses(db: Session, compound_ids: list[int], force: bool = False) -> dict[int, models.AnalysisJob]:
+    """Queue one analysis per compound in a single commit; returns jobs by compound id"""
+    now = _now()
+    queued = {
+        compound_id: models.AnalysisJob(
+            compound_id=compound_id,
+            status="queued",
+            force=force,
+            attempts=0,
+            max_attempts=settings.job_max_attempts,
+            available_at=now,
+        )
+        for compound_id in compound_ids
+    }
+    db.add_all(queued.values())
+    db.commit()
+    return queued
+
+
+def _fail_exhausted(db: Session, condition, now: datetime) -> None:
+    # Read first so an idle poll doesn't take the SQLite write lock
+    ids = db.execute(select(models.AnalysisJob.id).where(condition)).scalars().all()
+    if not ids:
+        return
+    db.execute(
+        update(models.AnalysisJob)
+        .where(models.AnalysisJob.id.in_(ids), condition)
+        .values(
+            status="failed",
+            error="Lease expired: worker stopped without finishing, and no attempts are left",
+            locked_by=None,
+            locked_until=None,
+            finished_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def claim_job(db: Session, worker_id: str) -> models.AnalysisJob | None:
+    """
+    Atomically take the oldest runnable job
+
+    A job is runnable when it is queued and past its available_at, or when it
+    is running but its visibility timeout has lapsed (the worker died) and it
+    has attempts left. Lapsed jobs without attempts left are marked failed, so
+    a job that keeps killing its worker is not leased forever.
+
+    Returns:
+        The claimed job, or None if the queue is empty
+    """
+    now = _now()
+    job = models.AnalysisJob
+    lapsed = (job.status == "running") & (job.locked_until < now)
+    _fail_exhausted(db, lapsed & (job.attempts >= job.max_attempts), now)
+    runnable = or_(
+        (job.status == "queued") & (job.available_at <= now),
+        lapsed & (job.attempts < job.max_attempts),
+    )
+    while True:
+        job_id = db.execute(
+            select(models.AnalysisJob.id).where(runnable).order_by(models.AnalysisJob.id).limit(1)
+        ).scalar_one_or_none()
+        if job_id is None:
+            return None
+        # Compare-and-set: only one worker's UPDATE can match the runnable state
+        result = db.execute(
+            update(models.AnalysisJob)
+            .where(models.AnalysisJob.id == job_id, runnable)
+            .values(
+                status="running",
+                locked_by=worker_id,
+                locked_until=now + timedelta(seconds=settings.job_visibility_timeout_seconds),
+                attempts=models.AnalysisJob.attempts + 1,
+                started_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        if result.rowcount == 1:
+            return db.get(models.AnalysisJob, job_id)
+
+
+def complete_job(db: Session, job: models.AnalysisJob, analysis_id: int) -> None:
+    job.status = "succeeded"
+    job.analysis_id = analysis_id
+    job.error = None
+    job.locked_by = None
+    job.locked_until = None
+    job.finished_at = _now()
+    db.commit()
+
+
+def fail_job(db: Session, job: models.AnalysisJob, error: str, retryable: bool = True) -> None:
+    """Requeue with linear backoff, or mark failed once attempts are exhausted"""
+    job.error = error
+    job.locked_by = None
+    job.locked_until = None
+    if retryable and job.attempts < job.max_attempts:
+        job.status = "queued"
+        job.available_at = _now() + timedelta(seconds=settings.job_retry_backoff_seconds * job.attempts)
+    else:
+        job.status = "failed"
+        job.finished_at = _now()
+    db.commit()
@@ -0,0 +1,155 @@
+"""Helpers for streamed, partial or slightly malformed JSON produced by LLMs"""
+from __future__ import annotations
+import json
+import re
+from typing import Any, List, Tuple
+
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_MAX_REPAIR_CUTS = 32
+
+
+class TopLevelFieldParser:
+    """
+    Feed text chunks of a JSON object as they arrive; get back each top-level
+    (key, value) pair as soon as its value closes.
+
+    Text before the opening brace (e.g. a stray preamble) is ignored.
+    Values that do not decode on their own are skipped rather than raised,
+    since the final document is validated separately.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start = -1
+        self._key: str | None = None
+        self._value_start = -1
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.buffer += chunk
+        fields: List[Tuple[str, Any]] = []
+        buf = self.buffer
+        while self._pos < len(buf) and not self.done:
+            ch = buf[self._pos]
+            if self._depth == 0:
+                # Skip anything before the opening brace
+                if ch == "{":
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._value_start == -1:
+                        self._key = self._decode(buf[self._key_start : self._pos + 1])
+            elif ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None and self._value_start == -1:
+                    self._key_start = self._pos
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 1:
+                    self._close_value(buf, fields)
+                    self.done = True
+                self._depth -= 1
+            elif self._depth == 1:
+                if ch == ":" and self._key is not None and self._value_start == -1:
+                    self._value_start = self._pos + 1
+                elif ch == ",":
+                    self._close_value(buf, fields)
+            self._pos += 1
+        return fields
+
+    def _close_value(self, buf: str, fields: List[Tuple[str, Any]]) -> None:
+        if self._key is not None and self._value_start != -1:
+            raw = buf[self._value_start : self._pos].strip()
+            try:
+                fields.append((self._key, json.loads(raw)))
+            except ValueError:
+                pass
+        self._key = None
+        self._key_start = -1
+        self._value_start = -1
+
+    @staticmethod
+    def _decode(raw: str) -> str | None:
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+
+def _scan(fragment: str) -> tuple[int | None, List[str], bool, List[int]]:
+    """Return (index closing the top-level value, pending closers, inside a string, structural comma offsets)"""
+    stack: List[str] = []
+    commas: List[int] = []
+    in_string = escape = False
+    for i, ch in enumerate(fragment):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return i, stack, False, commas
+        elif ch == ",":
+            commas.append(i)
+    return None, stack, in_string, commas
+
+
+def _close(piece: str) -> str:
+    _, stack, in_string, _ = _scan(piece)
+    if in_string:
+        piece += '"'
+    piece = piece.rstrip().rstrip(",")
+    if piece.endswith(":"):
+        piece += " null"
+    return piece + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> Any | None:
+    """
+    Best-effort local repair of an LLM JSON object
+
+    Handles leading prose or code fences, trailing commas, trailing text
+    after the object, and output truncated mid-document (open strings and
+    brackets are closed; an incomplete trailing member is dropped).
+
+    Returns:
+        The decoded object, or None if it could not be recovered
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    fragment = text[start:]
+    end, _, _, commas = _scan(fragment)
+    if end is not None:
+        candidates = [fragment[: end + 1]]
+    else:
+        # Truncated: close as-is, then retry with trailing members cut off
+        cuts = [len(fragment)] + commas[::-1][:_MAX_REPAIR_CUTS]
+        candidates = [_close(fragment[:cut]) for cut in cuts]
+    for candidate in candidates:
+        for attempt in (candidate, _TRAILING_COMMA.sub(r"\1", candidate)):
+            try:
+                return json.loads(attempt)
+            except ValueError:
+                continue
+    return None
@@ -0,0 +1,374 @@
+"""Library export/import as NDJSON: ingredients, compounds (with formula lines) and analyses"""
+from __future__ import annotations
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from pydantic_settings import BaseSettings
+from sqlalchemy import and_, func, insert, or_, select, text, update
+from sqlalchemy.orm import Session, undefer
+
+from app import models, schemas
+from app.services import analysis_store, compound_cache, compound_crud, ingredient_crud
+
+
+class LibrarySettings(BaseSettings):
+    # Rows read per keyset page on export and written per transaction on import
+    library_io_chunk_size: int = int(os.getenv("LIBRARY_IO_CHUNK_SIZE", "1000"))
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+settings = LibrarySettings()
+
+FORMAT = "perfume-library"
+VERSION = 1
+# Export order; import relies on ingredients and compounds preceding what references them
+SECTIONS = ("ingredient", "compound", "analysis")
+
+
+class LibraryFormatError(ValueError):
+    """A record that can't be imported; the message names the problem"""
+
+
+def header() -> Dict:
+    return {"type": "header", "format": FORMAT, "version": VERSION, "exported_at": datetime.now(timezone.utc).isoformat()}
+
+
+def _iso(value) -> str | None:
+    return value.isoformat() if value else None
+
+
+def _ingredient_page(db: Session, after, limit: int) -> Tuple[List[Dict], int | None]:
+    table = models.Ingredient.__table__
+    rows = db.execute(select(table).where(table.c.id > (after or 0)).order_by(table.c.id).limit(limit))
+    records = [dict(ingredient_crud.to_read(row), type="ingredient") for row in rows]
+    return records, records[-1]["id"] if records else None
+
+
+def _compound_page(db: Session, after, limit: int) -> Tuple[List[Dict], int | None]:
+    c = models.Compound.__table__
+    compounds = db.execute(select(c).where(c.c.id > (after or 0)).order_by(c.c.id).limit(limit)).all()
+    if not compounds:
+        return [], None
+    ci, i = models.CompoundIngredient.__table__, models.Ingredient.__table__
+    items: Dict[int, List[Dict]] = {}
+    lines = db.execute(
+        select(ci.c.compound_id, ci.c.ingredient_id, i.c.name, ci.c.percentage)
+        .join(i, i.c.id == ci.c.ingredient_id)
+        .where(ci.c.compound_id.in_([row.id for row in compounds]))
+        .order_by(ci.c.compound_id, ci.c.id)
+    )
+    for line in lines:
+        items.setdefault(line.compound_id, []).append(
+            {"ingredient_id": line.ingredient_id, "ingredient_name": line.name, "percentage": line.percentage}
+        )
+    records = [
+        {
+            "type": "compound",
+            "id": row.id,
+            "name": row.name,
+            "description": row.description,
+            "created_at": _iso(row.created_at),
+            "updated_at": _iso(row.updated_at),
+            "items": items.get(row.id, []),
+        }
+        for row in compounds
+    ]
+    return records, records[-1]["id"]
+
+
+def _analysis_page(db: Session, after, limit: int) -> Tuple[List[Dict], Tuple[int, int] | None]:
+    # Grouped by compound (on ix_analyses_compound_id_id) so import can dedupe one compound at a time
+    a = models.Analysis
+    stmt = (
+        select(a, models.Prompt.text)
+        .outerjoin(models.Prompt, models.Prompt.hash == a.prompt_hash)
+        .order_by(a.compound_id, a.id)
+        .limit(limit)
+        .options(undefer(a.result_json), undefer(a.raw_response_z), undefer(a.legacy_prompt_text), undefer(a.legacy_raw_response))
+    )
+    if after:
+        stmt = stmt.where(or_(a.compound_id > after[0], and_(a.compound_id == after[0], a.id > after[1])))
+    rows = db.execute(stmt).all()
+    records = [dict(analysis_store.to_record(analysis, prompt_text), type="analysis") for analysis, prompt_text in rows]
+    # Nothing is written through these objects; don't let the identity map grow with the export
+    db.expunge_all()
+    return records, (records[-1]["compound_id"], records[-1]["id"]) if records else None
+
+
+_PAGES = {"ingredient": _ingredient_page, "compound": _compound_page, "analysis": _analysis_page}
+
+
+def export_page(db: Session, section: str, after, limit: int) -> Tuple[List[Dict], object]:
+    """
+    One keyset page of a section
+
+    Args:
+        db: Database session (see begin_snapshot for a consistent view across pages)
+        section: One of SECTIONS
+        after: Cursor returned with the previous page (None to start)
+        limit: Page size
+
+    Returns:
+        (records, cursor for the next page or None when the section is exhausted)
+    """
+    return _PAGES[section](db, after, limit)
+
+
+def begin_snapshot(db: Session) -> None:
+    """Open the read transaction that all export pages are read in, so they form one consistent snapshot (call first)"""
+    if db.get_bind().dialect.name == "sqlite":
+        # pysqlite and aiosqlite emit no BEGIN before a SELECT, so each page would see the latest commit.
+        # WAL checkpoints can't pass the snapshot until the session ends
+        db.execute(text("BEGIN"))
+    else:
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+
+def iter_export(db: Session, sections: Iterable[str] = SECTIONS, chunk_size: int | None = None) -> Iterator[Dict]:
+    """Header, then every record of the given sections, reading one page at a time"""
+    chunk_size = chunk_size or settings.library_io_chunk_size
+    begin_snapshot(db)
+    yield header()
+    for section in sections:
+        cursor = None
+        while True:
+            records, cursor = export_page(db, section, cursor, chunk_size)
+            if cursor is None:
+                break
+            yield from records
+
+
+@dataclass
+class ImportState:
+    """Source-to-target id maps, counters and the pending chunk of one import"""
+
+    chunk_size: int = field(default_factory=lambda: settings.library_io_chunk_size)
+    ingredient_ids: Dict[int, int] = field(default_factory=dict)
+    compound_ids: Dict[int, int] = field(default_factory=dict)
+    stats: Dict[str, int] = field(
+        default_factory=lambda: {
+            "ingredients_inserted": 0,
+            "ingredients_updated": 0,
+            "compounds_inserted": 0,
+            "compounds_updated": 0,
+            "compounds_unchanged": 0,
+            "analyses_inserted": 0,
+            "analyses_skipped": 0,
+        }
+    )
+    section: str | None = None
+    pending: List[Dict] = field(default_factory=list)
+    # Analysis dedup for the compound being imported: copies already stored vs seen in the stream
+    analysis_compound: int | None = None
+    analysis_stored: Counter = field(default_factory=Counter)
+    analysis_seen: Counter = field(default_factory=Counter)
+
+    def add(self, record: Dict) -> Tuple[str, List[Dict]] | None:
+        """Buffer a record; returns a (section, records) chunk when one is ready to import"""
+        kind = record.get("type") if isinstance(record, dict) else None
+        if kind == "header":
+            check_header(record)
+            return None
+        if kind not in _IMPORTERS:
+            raise LibraryFormatError(f"Unknown record type {kind!r}")
+        ready = None
+        if self.pending and (kind != self.section or len(self.pending) >= self.chunk_size):
+            ready = self.drain()
+        self.section = kind
+        self.pending.append(record)
+        return ready
+
+    def drain(self) -> Tuple[str, List[Dict]] | None:
+        """The buffered partial chunk, if any"""
+        if not self.pending:
+            return None
+        ready = (self.section, self.pending)
+        self.pending = []
+        return ready
+
+
+def check_header(record: Dict) -> None:
+    if record.get("format") != FORMAT:
+        raise LibraryFormatError(f"Not a {FORMAT} export")
+    if int(record.get("version", 0)) > VERSION:
+        raise LibraryFormatError(f"Export version {record.get('version')} is newer than supported ({VERSION})")
+
+
+def _import_ingredients(db: Session, records: List[Dict], state: ImportState) -> None:
+    rows = [ingredient_crud.to_row(schemas.IngredientCreate.model_validate(r)) for r in records]
+    ids, inserted, updated = ingredient_crud.upsert_rows(db, rows)
+    for record, row in zip(records, rows):
+        if "id" in record:
+            state.ingredient_ids[record["id"]] = ids[row["normalized_name"]]
+    state.stats["ingredients_inserted"] += inserted
+    state.stats["ingredients_updated"] += updated
+
+
+def _resolve_lines(db: Session, records: List[Dict], state: ImportState) -> Dict[int, List[Tuple[int, float]]]:
+    # Lines whose ingredient wasn't in the stream are matched (or created) by name
+    names = [
+        item.get("ingredient_name")
+        for r in records
+        for item in r.get("items", [])
+        if item.get("ingredient_id") not in state.ingredient_ids
+    ]
+    if any(not name for name in names):
+        raise LibraryFormatError("Formula line without a known ingredient_id or an ingredient_name")
+    _, by_key = ingredient_crud.resolve_ingredients(db, [], names)
+    lines: Dict[int, List[Tuple[int, float]]] = {}
+    for index, r in enumerate(records):
+        resolved = []
+        for item in r.get("items", []):
+            target = state.ingredient_ids.get(item.get("ingredient_id"))
+            if target is None:
+                target = by_key[models.normalize_name(item["ingredient_name"])][0]
+            resolved.append((target, float(item["percentage"])))
+        lines[index] = resolved
+    return lines
+
+
+def _stored_time(value) -> datetime:
+    # Whole seconds, like the CURRENT_TIMESTAMP defaults the rest of the table was written with
+    return (datetime.fromisoformat(value) if isinstance(value, str) else value).replace(microsecond=0)
+
+
+def _import_compounds(db: Session, records: List[Dict], state: ImportState) -> None:
+    lines = _resolve_lines(db, records, state)
+    c = models.Compound.__table__
+    # Same name and creation time means the same compound (a previous import of this export)
+    created = {index: _stored_time(r["created_at"]) if r.get("created_at") else None for index, r in enumerate(records)}
+    existing: Dict[Tuple[str, datetime], Tuple[int, str | None]] = {}
+    for row in db.execute(select(c.c.id, c.c.name, c.c.description, c.c.created_at).where(c.c.name.in_({r["name"] for r in records}))):
+        if row.created_at:
+            existing[(row.name, _stored_time(row.created_at))] = (row.id, row.description)
+
+    new_rows, new_indexes = [], []
+    for index, r in enumerate(records):
+        match = existing.get((r["name"], created[index])) if created[index] else None
+        if match is None:
+            row = {"name": r["name"], "description": r.get("description")}
+            if created[index]:
+                row["created_at"] = created[index]
+            if r.get("updated_at"):
+                row["updated_at"] = _stored_time(r["updated_at"])
+            new_rows.append(row)
+            new_indexes.append(index)
+            continue
+        target_id, description = match
+        changed = compound_crud.sync_items(db, target_id, lines[index])
+        if description != r.get("description"):
+            db.execute(update(c).where(c.c.id == target_id).values(description=r.get("description")))
+            changed = True
+        if changed:
+            compound_cache.invalidate(target_id)
+        state.stats["compounds_updated" if changed else "compounds_unchanged"] += 1
+        if "id" in r:
+            state.compound_ids[r["id"]] = target_id
+
+    if new_rows:
+        # Rows differ in which timestamps they carry; insert per shape so server defaults still apply
+        shapes: Dict[Tuple[str, ...], List[int]] = {}
+        for position, row in enumerate(new_rows):
+            shapes.setdefault(tuple(sorted(row)), []).append(position)
+        new_ids: Dict[int, int] = {}
+        for positions in shapes.values():
+            ids = db.execute(insert(c).returning(c.c.id, sort_by_parameter_order=True), [new_rows[p] for p in positions]).scalars().all()
+            new_ids.update(zip(positions, ids))
+        new_lines = [
+            {"compound_id": new_ids[position], "ingredient_id": ingredient_id, "percentage": pct}
+            for position, index in enumerate(new_indexes)
+            for ingredient_id, pct in lines[index]
+        ]
+        if new_lines:
+            db.execute(insert(models.CompoundIngredient.__table__), new_lines)
+        for position, index in enumerate(new_indexes):
+            if "id" in records[index]:
+                state.compound_ids[records[index]["id"]] = new_ids[position]
+        state.stats["compounds_inserted"] += len(new_rows)
+
+
+def _import_analyses(db: Session, records: List[Dict], state: ImportState) -> None:
+    a = models.Analysis.__table__
+    targets = {state.compound_ids.get(r["compound_id"]) for r in records} - {None, state.analysis_compound}
+    stored: Dict[int, Counter] = {target: Counter() for target in targets}
+    if targets:
+        counts = db.execute(
+            select(a.c.compound_id, a.c.model, a.c.prompt_version, a.c.created_at, func.count())
+            .where(a.c.compound_id.in_(targets))
+            .group_by(a.c.compound_id, a.c.model, a.c.prompt_version, a.c.created_at)
+        )
+        for compound_id, model, prompt_version, created_at, n in counts:
+            stored[compound_id][(model, prompt_version, _iso(created_at))] = n
+
+    fresh = []
+    for r in records:
+        target = state.compound_ids.get(r["compound_id"])
+        if target is None:
+            state.stats["analyses_skipped"] += 1
+            continue
+        if target != state.analysis_compound:
+            state.analysis_compound, state.analysis_stored, state.analysis_seen = target, stored[target], Counter()
+        # The n-th copy of an identical (model, prompt version, time) analysis is skipped if n are already stored
+        key = (r["model"], r["prompt_version"], r.get("created_at"))
+        state.analysis_seen[key] += 1
+        if r.get("created_at") and state.analysis_seen[key] <= state.analysis_stored[key]:
+            state.stats["analyses_skipped"] += 1
+            continue
+        fresh.append(dict(r, compound_id=target))
+    if fresh:
+        db.execute(insert(a), analysis_store.rows_from_records(db, fresh))
+    state.stats["analyses_inserted"] += len(fresh)
+
+
+_IMPORTERS = {"ingredient": _import_ingredients, "compound": _import_compounds, "analysis": _import_analyses}
+
+
+def import_chunk(db: Session, section: str, records: List[Dict], state: ImportState) -> None:
+    """
+    Import records of one section and commit
+
+    Args:
+        db: Database session
+        section: One of SECTIONS
+        records: Records of that section, in stream order
+        state: Id maps and counters, shared by all chunks of one import
+
+    Raises:
+        LibraryFormatError: A record is missing fields or references nothing importable
+    """
+    try:
+        _IMPORTERS[section](db, records, state)
+    except (KeyError, TypeError, ValueError) as e:
+        db.rollback()
+        if isinstance(e, LibraryFormatError):
+            raise
+        raise LibraryFormatError(f"Invalid {section} record: {type(e).__name__}: {e}") from e
+    db.commit()
+
+
+def import_records(db: Session, records: Iterable[Dict], chunk_size: int | None = None) -> Dict[str, int]:
+    """
+    Import an export stream, committing per chunk; safe to re-run with the same export
+
+    Ingredients are upserted by normalized name, compounds matched by name and
+    creation time (formula and description updated in place), and analyses
+    skipped when their compound already has one from the same model and time.
+
+    Returns:
+        Counters per section
+    """
+    state = ImportState(chunk_size=chunk_size or settings.library_io_chunk_size)
+    for record in records:
+        ready = state.add(record)
+        if ready:
+            import_chunk(db, *ready, state)
+    ready = state.drain()
+    if ready:
+        import_chunk(db, *ready, state)
+    return state.stats
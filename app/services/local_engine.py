@@ -0,0 +1,132 @@
+"""Deterministic rule-based analysis built from the knowledge base (no LLM)"""
+from __future__ import annotations
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from .analysis import KnowledgeItem
+
+LOCAL_MODEL_NAME = "local-rules"
+LOCAL_ENGINE_VERSION = "local-v1"
+
+# Rough evaporation lifetime contributed by each tier, in hours at 100%
+_TIER_HOURS = {"top": 1.5, "heart": 5.0, "base": 12.0}
+_DIFFUSIVE_NOTES = {"diffusive", "ambergris", "amber", "fresh", "citrus"}
+
+# Well-known fragrance styles per dominant family pair, used for "similar scents"
+_STYLE_REFERENCES: Dict[Tuple[str, ...], List[str]] = {
+    ("citrus",): ["Classic Eau de Cologne"],
+    ("floral",): ["Soliflore floral"],
+    ("woody",): ["Modern woody"],
+    ("amber",): ["Ambery skin scent"],
+    ("amber", "woody"): ["Woody-amber (e.g. Iso E Super / Ambroxan skin scents)"],
+    ("citrus", "floral"): ["Fresh floral cologne"],
+    ("floral", "jasmine"): ["Transparent jasmine (Hedione-led florals)"],
+    ("citrus", "woody"): ["Citrus aromatic woody"],
+}
+
+Line = Tuple[str, float, "KnowledgeItem | None"]
+
+
+def _style_references(families: List[str]) -> List[dict]:
+    refs: List[dict] = []
+    for key in (tuple(sorted(families[:2])), tuple(families[:1])):
+        for name in _STYLE_REFERENCES.get(key, []):
+            if all(r["name"] != name for r in refs):
+                refs.append({"name": name, "reason": f"Dominant families: {', '.join(families[:2])}"})
+    return refs
+
+
+def analyze_lines(lines: List[Line], derived: dict) -> dict:
+    """
+    Build a complete AnalysisResult payload from matched formula lines
+
+    Args:
+        lines: (ingredient name, normalized %, matched KnowledgeItem or None)
+        derived: Output of derive_features for the same formula
+
+    Returns:
+        Dict with every AnalysisResult field populated
+    """
+    tiers: Dict[str, List[dict]] = {"top": [], "heart": [], "base": []}
+    suggestions: List[dict] = []
+    risks: List[dict] = []
+    unknown: List[str] = []
+    family_notes: Dict[str, Dict[str, float]] = {}
+    matched_pct = 0.0
+    diffusive_pct = 0.0
+
+    for name, pct, item in lines:
+        if item is None:
+            unknown.append(name)
+            continue
+        matched_pct += pct
+        if _DIFFUSIVE_NOTES.intersection(item.primary_notes):
+            diffusive_pct += pct
+        for family in item.family:
+            notes = family_notes.setdefault(family, {})
+            for note in item.primary_notes:
+                notes[note] = notes.get(note, 0.0) + pct
+        if item.volatility in tiers:
+            tiers[item.volatility].append(
+                {"name": name, "percentage": pct, "reason": f"{item.volatility} material; {', '.join(item.primary_notes[:3])}"}
+            )
+        if item.typical_range_pct:
+            low, high = item.typical_range_pct
+            if pct > high:
+                suggestions.append({"ingredient": name, "suggestion": f"Reduce toward {high}% (typical {low}-{high}%)", "current_pct": pct})
+                risks.append({"type": "overdose", "ingredient": name, "detail": f"{pct}% exceeds typical maximum {high}%"})
+            elif pct < low:
+                suggestions.append({"ingredient": name, "suggestion": f"Increase toward {low}% to be perceptible (typical {low}-{high}%)", "current_pct": pct})
+
+    for tier in tiers.values():
+        tier.sort(key=lambda n: n["percentage"], reverse=True)
+
+    volatility = derived["volatility_profile"]
+    for tier, label in (("top", "top notes for lift"), ("heart", "a heart for body"), ("base", "base notes for tenacity")):
+        if volatility.get(tier, 0.0) == 0.0 and matched_pct > 0:
+            suggestions.append({"ingredient": None, "suggestion": f"Add {label}", "current_pct": 0.0})
+
+    allergens = derived["allergens"]
+    if allergens:
+        risks.append({"type": "allergen", "detail": f"Declarable allergens present: {', '.join(allergens)}"})
+    if unknown:
+        risks.append({"type": "unrecognized", "detail": f"Not in knowledge base: {', '.join(unknown)}"})
+
+    families = derived["olfactive_family"]
+    accords = []
+    for family in families:
+        notes = sorted(family_notes.get(family, {}).items(), key=lambda x: x[1], reverse=True)
+        accords.append({"name": f"{family} accord", "description": f"Led by {', '.join(n for n, _ in notes[:3])}"})
+
+    total = sum(pct for _, pct, _ in lines) or 1.0
+    longevity = round(sum(_TIER_HOURS[t] * volatility.get(t, 0.0) / 100.0 for t in _TIER_HOURS), 1) if matched_pct else None
+    diffusive_share = diffusive_pct / total
+    projection = "strong" if diffusive_share >= 0.5 else "moderate" if diffusive_share >= 0.2 else "soft"
+    coverage = matched_pct / total
+
+    summary = (
+        f"{' / '.join(families) or 'Unclassified'} composition; "
+        f"volatility top {volatility.get('top', 0.0)}%, heart {volatility.get('heart', 0.0)}%, base {volatility.get('base', 0.0)}%. "
+        f"{len(lines) - len(unknown)} of {len(lines)} ingredients recognized."
+    )
+
+    return {
+        "summary": summary,
+        "olfactive_family": families,
+        "top_notes": tiers["top"],
+        "heart_notes": tiers["heart"],
+        "base_notes": tiers["base"],
+        "accords": accords,
+        "volatility_profile": volatility,
+        "projection": projection if matched_pct else None,
+        "longevity_hours": longevity,
+        "similar_popular_scents": _style_references(families),
+        "improvement_suggestions": suggestions,
+        "safety_compliance": {
+            "flags": ["advisory-only"],
+            "allergens": allergens,
+            "notes": "Rule-based estimate; run formal IFRA checks.",
+        },
+        "risks": risks,
+        "confidence": round(0.6 * coverage, 2),
+    }
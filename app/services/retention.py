@@ -0,0 +1,202 @@
+"""Analysis retention: keep the latest N per compound plus pinned rows, archive the rest as NDJSON.gz"""
+from __future__ import annotations
+import gzip
+import json
+import os
+from typing import Dict, Iterable, Iterator, List
+
+from pydantic_settings import BaseSettings
+from sqlalchemy import delete, exists, false, func, select, update
+from sqlalchemy.orm import Session, undefer
+
+from app import models
+from app.services import analysis_store
+
+
+class RetentionSettings(BaseSettings):
+    # Newest analyses kept per compound (pinned ones are kept on top); 0 disables pruning
+    analysis_retention_keep: int = int(os.getenv("ANALYSIS_RETENTION_KEEP", "20"))
+    # Pruned rows are appended to <dir>/analyses-YYYY-MM-DD.ndjson.gz, by creation date
+    analysis_archive_dir: str = os.getenv("ANALYSIS_ARCHIVE_DIR", "archive")
+    # Rows archived and deleted per transaction
+    analysis_retention_batch_size: int = int(os.getenv("ANALYSIS_RETENTION_BATCH_SIZE", "500"))
+    # How often the worker runs a pass; 0 disables the background pass
+    analysis_retention_interval_seconds: float = float(os.getenv("ANALYSIS_RETENTION_INTERVAL_SECONDS", "3600"))
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+settings = RetentionSettings()
+
+
+def _prunable_batches(db: Session, keep: int, batch_size: int) -> Iterator[List[int]]:
+    # Only compounds over the limit are visited; each cutoff is one probe of ix_analyses_compound_id_id
+    a = models.Analysis
+    over = db.execute(select(a.compound_id).group_by(a.compound_id).having(func.count() > keep)).scalars().all()
+    batch: List[int] = []
+    for compound_id in over:
+        cutoff = db.execute(
+            select(a.id).where(a.compound_id == compound_id).order_by(a.id.desc()).offset(keep - 1).limit(1)
+        ).scalar()
+        last_id = 0
+        while cutoff is not None:
+            ids = db.execute(
+                select(a.id)
+                .where(a.compound_id == compound_id, a.id < cutoff, a.id > last_id, a.pinned == false())
+                .order_by(a.id)
+                .limit(batch_size - len(batch))
+            ).scalars().all()
+            if not ids:
+                break
+            batch.extend(ids)
+            last_id = ids[-1]
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _archive_path(archive_dir: str, created_at: str | None) -> str:
+    day = created_at[:10] if created_at else "undated"
+    return os.path.join(archive_dir, f"analyses-{day}.ndjson.gz")
+
+
+def _append_archive(path: str, records: List[Dict]) -> None:
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    # Each append is its own gzip member; readers see one continuous stream
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(filename="", mode="wb", fileobj=raw) as gz:
+            gz.write(data)
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def _archive_and_delete(db: Session, ids: List[int], archive_dir: str) -> tuple[int, set[str]]:
+    a = models.Analysis
+    rows = db.execute(
+        select(a, models.Prompt.text)
+        .outerjoin(models.Prompt, models.Prompt.hash == a.prompt_hash)
+        .where(a.id.in_(ids))
+        .order_by(a.id)
+        .options(undefer(a.result_json), undefer(a.raw_response_z), undefer(a.legacy_prompt_text), undefer(a.legacy_raw_response))
+    ).all()
+    by_file: Dict[str, List[Dict]] = {}
+    hashes = set()
+    for analysis, prompt_text in rows:
+        record = analysis_store.to_record(analysis, prompt_text)
+        by_file.setdefault(_archive_path(archive_dir, record["created_at"]), []).append(record)
+        if analysis.prompt_hash:
+            hashes.add(analysis.prompt_hash)
+    # Written and synced before the delete commits; a crash in between only leaves duplicates, which restore skips
+    for path, records in by_file.items():
+        _append_archive(path, records)
+    db.expunge_all()
+
+    jobs = models.AnalysisJob.__table__
+    db.execute(update(jobs).where(jobs.c.analysis_id.in_(ids)).values(analysis_id=None))
+    db.execute(delete(a.__table__).where(a.__table__.c.id.in_(ids)))
+    deleted_prompts = 0
+    if hashes:
+        p = models.Prompt.__table__
+        referenced = exists().where(a.__table__.c.prompt_hash == p.c.hash)
+        deleted_prompts = db.execute(delete(p).where(p.c.hash.in_(hashes), ~referenced)).rowcount
+    db.commit()
+    return deleted_prompts, set(by_file)
+
+
+def prune_analyses(db: Session, keep: int | None = None, archive_dir: str | None = None, batch_size: int | None = None) -> Dict[str, int]:
+    """
+    Archive and delete analyses beyond the newest `keep` per compound, committing per batch
+
+    Pinned analyses are never pruned. Prompts no longer referenced by any
+    analysis are deleted along with the last row that used them.
+
+    Args:
+        db: Database session
+        keep: Newest analyses kept per compound (default ANALYSIS_RETENTION_KEEP; 0 disables)
+        archive_dir: Archive directory (default ANALYSIS_ARCHIVE_DIR)
+        batch_size: Rows per transaction (default ANALYSIS_RETENTION_BATCH_SIZE)
+
+    Returns:
+        Counters: archived rows, deleted prompts, batches, archive files written to
+    """
+    keep = settings.analysis_retention_keep if keep is None else keep
+    archive_dir = archive_dir or settings.analysis_archive_dir
+    batch_size = batch_size or settings.analysis_retention_batch_size
+    stats = {"archived": 0, "prompts_deleted": 0, "batches": 0, "files": 0}
+    if keep <= 0:
+        return stats
+
+    os.makedirs(archive_dir, exist_ok=True)
+    files: set[str] = set()
+    # Materialized first: the batches below delete from the table being scanned
+    for ids in list(_prunable_batches(db, keep, batch_size)):
+        deleted_prompts, written = _archive_and_delete(db, ids, archive_dir)
+        stats["archived"] += len(ids)
+        stats["prompts_deleted"] += deleted_prompts
+        stats["batches"] += 1
+        files |= written
+    stats["files"] = len(files)
+    return stats
+
+
+def read_archive(path: str) -> Iterator[Dict]:
+    """Records of an archive file, in write order"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def restore_analyses(
+    db: Session, records: Iterable[Dict], pin: bool = False, compound_id: int | None = None, batch_size: int | None = None
+) -> Dict[str, int]:
+    """
+    Re-import archived analyses with their original ids, committing per batch
+
+    Idempotent: rows whose id already exists are skipped, as are rows of
+    compounds that were deleted since. Unpinned rows older than the retention
+    window are archived again by the next pruning pass.
+
+    Args:
+        db: Database session
+        records: Archive records (see read_archive)
+        pin: Pin restored rows so retention keeps them
+        compound_id: Only restore this compound's analyses
+        batch_size: Rows per transaction (default ANALYSIS_RETENTION_BATCH_SIZE)
+
+    Returns:
+        Counters: restored, skipped (already present or compound missing)
+    """
+    batch_size = batch_size or settings.analysis_retention_batch_size
+    stats = {"restored": 0, "skipped": 0}
+    batch: List[Dict] = []
+
+    def _flush() -> None:
+        a = models.Analysis.__table__
+        unique = {r["id"]: r for r in batch}
+        present = set(db.execute(select(a.c.id).where(a.c.id.in_(list(unique)))).scalars())
+        compounds = models.Compound.__table__
+        known = set(
+            db.execute(select(compounds.c.id).where(compounds.c.id.in_({r["compound_id"] for r in unique.values()}))).scalars()
+        )
+        rows = [r for i, r in unique.items() if i not in present and r["compound_id"] in known]
+        if rows:
+            db.execute(a.insert(), analysis_store.rows_from_records(db, rows, keep_ids=True, pin=pin))
+        db.commit()
+        stats["restored"] += len(rows)
+        stats["skipped"] += len(batch) - len(rows)
+        batch.clear()
+
+    for record in records:
+        if compound_id is not None and record["compound_id"] != compound_id:
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            _flush()
+    if batch:
+        _flush()
+    return stats
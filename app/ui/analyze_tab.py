@@ -2,7 +2,7 @@
 import streamlit as st
 from app.db import get_db
 from app.services.compound_crud import get_all_compounds, get_compound
-from app.services.analysis import analyze_formula
+from app.services.analysis import analyze_formula, analyze_local, resolve_mode
 
 
 def render():
@@ -58,13 +58,23 @@ def render():
             """, unsafe_allow_html=True)
 
     st.markdown("<br>", unsafe_allow_html=True)
+    engine = st.radio(
+        "Analysis engine",
+        ["llm", "local"],
+        format_func=lambda m: {"llm": "🧠 LLM (detailed)", "local": "⚡ Rule-based (instant)"}[m],
+        horizontal=True,
+    )
+    force_refresh = st.checkbox("Ignore cached result", help="Re-run the LLM even if this formula was analyzed recently")
     if st.button("🔬 Analyze Composition", type="primary", use_container_width=True):
         with st.spinner("🧠 AI is analyzing your compound..."):
             # Prepare formula as list of tuples
             formula = [(ing["name"], ing["percentage"]) for ing in compound_data["ingredients"]]
 
-            # Run analysis
-            prompt, json_str, result = analyze_formula(formula)
+            # Run analysis (falls back to the rule-based engine when no LLM is configured)
+            if resolve_mode(engine) == "llm":
+                prompt, json_str, result = analyze_formula(formula, db=db, force=force_refresh)
+            else:
+                prompt, json_str, result = analyze_local(formula)
 
             # Store in session state
             st.session_state.analysis_result = result
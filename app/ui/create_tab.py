@@ -2,19 +2,19 @@
 import streamlit as st
 from app.db import get_db
 from app.services.compound_crud import create_compound
+from app.services.ingredient_search import search_ingredients
 
-# Popular perfume ingredients
-POPULAR_INGREDIENTS = [
-    "Bergamot Oil", "Lemon Oil", "Orange Oil", "Grapefruit Oil", "Lime Oil",
-    "Lavender Oil", "Rose Oil", "Jasmine Absolute", "Ylang-Ylang Oil", "Neroli Oil",
-    "Geranium Oil", "Iris Absolute", "Violet Leaf Absolute", "Tuberose Absolute",
-    "Sandalwood Oil", "Cedarwood Oil", "Patchouli Oil", "Vetiver Oil", "Oakmoss Absolute",
-    "Vanilla Absolute", "Tonka Bean Absolute", "Benzoin Resinoid", "Labdanum Absolute",
-    "Limonene", "Linalool", "Geraniol", "Citronellol", "Eugenol",
-    "Coumarin", "Iso E Super", "Hedione", "Galaxolide", "Ambroxan",
-    "Cashmeran", "Ethyl Maltol", "Methyl Anthranilate", "Cinnamic Aldehyde",
-    "Musk Ketone", "Indole", "Phenylethyl Alcohol", "Benzyl Salicylate"
-]
+CUSTOM_OPTION = "+ Add as new ingredient"
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _suggest(query: str) -> list[str]:
+    """Typeahead names for a partial ingredient name, alias, tag or CAS number"""
+    db = next(get_db())
+    try:
+        return [hit["name"] for hit in search_ingredients(db, query, limit=15)]
+    finally:
+        db.close()
 
 
 def render():
@@ -67,26 +67,27 @@ def render():
 
         st.markdown(f"**Ingredient {idx+1}**")
 
-        # Ingredient name with autocomplete
-        ingredient_name = st.selectbox(
-            f"Select or type ingredient {idx+1}",
-            [""] + POPULAR_INGREDIENTS + ["+ Add Custom"],
-            key=f"select_{idx}",
+        # Ingredient name with typeahead over the ingredient database
+        query = st.text_input(
+            f"Search ingredient {idx+1}",
+            value=ing["name"],
+            key=f"search_{idx}",
+            placeholder="Type a name, alias, tag or CAS number",
             label_visibility="collapsed"
-        )
-
-        # If user selects "Add Custom" or wants to type, show text input
-        if ingredient_name == "+ Add Custom" or (ingredient_name == "" and ing["name"]):
-            custom_name = st.text_input(
-                f"Custom ingredient {idx+1}",
-                value=ing["name"],
-                key=f"custom_{idx}",
-                placeholder="Enter custom ingredient name",
+        ).strip()
+
+        if query:
+            suggestions = _suggest(query)
+            options = suggestions if query in suggestions else suggestions + [CUSTOM_OPTION]
+            ingredient_name = st.selectbox(
+                f"Matching ingredients {idx+1}",
+                options,
+                key=f"select_{idx}",
                 label_visibility="collapsed"
             )
-            ing["name"] = custom_name
-        elif ingredient_name:
-            ing["name"] = ingredient_name
+            ing["name"] = query if ingredient_name == CUSTOM_OPTION else ingredient_name
+        else:
+            ing["name"] = ""
 
         # Percentage input with remove button side by side
         col1, col2 = st.columns([4, 1])
@@ -192,8 +193,8 @@ def render():
     with st.expander("💡 Tips for Creating Compounds"):
         st.markdown("""
         **Best Practices:**
-        - Use the dropdown to select from 40+ popular ingredients
-        - Choose "+ Add Custom" to enter your own ingredients
+        - Type part of a name, alias, family tag or CAS number and pick a match
+        - Choose "+ Add as new ingredient" to use exactly what you typed
         - Ensure percentages add up to exactly 100%
         - Include at least 3-5 ingredients for meaningful analysis
 
@@ -0,0 +1,106 @@
+"""Analysis worker: python -m app.worker [--concurrency N] [--once]"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import socket
+import uuid
+
+from .db import SessionLocal, init_db, shutdown_db
+from . import models
+from .services import analysis_store, compound_crud, jobs, retention
+from .services.analysis import analyze_formula_async, analyze_local, resolve_mode, result_provenance
+from .services.groq_client import close_groq_clients
+
+
+async def run_job(job_id: int) -> None:
+    db = SessionLocal()
+    try:
+        job = db.get(models.AnalysisJob, job_id)
+        compound = db.get(models.Compound, job.compound_id)
+        if compound is None:
+            jobs.fail_job(db, job, "Compound not found", retryable=False)
+            return
+        formula = [(item["ingredient_name"], item["percentage"]) for item in compound_crud.get_items(db, compound.id)]
+        if not formula:
+            jobs.fail_job(db, job, "Compound has no ingredients", retryable=False)
+            return
+
+        mode = resolve_mode("llm")
+        try:
+            if mode == "llm":
+                prompt_text, raw_response, parsed = await analyze_formula_async(formula, db=db, force=job.force)
+            else:
+                prompt_text, raw_response, parsed = analyze_local(formula)
+        except Exception as e:
+            db.rollback()
+            jobs.fail_job(db, job, f"{type(e).__name__}: {e}")
+            return
+
+        model, prompt_version = result_provenance(mode)
+        analysis = analysis_store.add_analysis(db, compound.id, model, prompt_version, prompt_text, raw_response, parsed)
+        db.flush()
+        jobs.complete_job(db, job, analysis.id)
+    finally:
+        db.close()
+
+
+async def worker_loop(worker_id: str, poll_interval: float, once: bool) -> None:
+    while True:
+        db = SessionLocal()
+        try:
+            job = jobs.claim_job(db, worker_id)
+            job_id = job.id if job else None
+        finally:
+            db.close()
+        if job_id is None:
+            if once:
+                return
+            await asyncio.sleep(poll_interval)
+            continue
+        await run_job(job_id)
+
+
+def _prune_once() -> None:
+    db = SessionLocal()
+    try:
+        stats = retention.prune_analyses(db)
+    finally:
+        db.close()
+    if stats["archived"]:
+        print(f"Retention: archived {stats['archived']} analyses, deleted {stats['prompts_deleted']} unused prompts")
+
+
+async def retention_loop(interval: float) -> None:
+    # Sync batches off the event loop; each batch commits on its own so job writers are only briefly blocked
+    while True:
+        try:
+            await asyncio.to_thread(_prune_once)
+        except Exception as e:
+            print(f"Retention pass failed: {type(e).__name__}: {e}")
+        await asyncio.sleep(interval)
+
+
+async def main(concurrency: int, poll_interval: float, once: bool) -> None:
+    base_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    loops = [worker_loop(f"{base_id}/{i}", poll_interval, once) for i in range(concurrency)]
+    interval = retention.settings.analysis_retention_interval_seconds
+    retention_task = asyncio.create_task(retention_loop(interval)) if interval > 0 and not once else None
+    try:
+        await asyncio.gather(*loops)
+    finally:
+        if retention_task is not None:
+            retention_task.cancel()
+        await close_groq_clients()
+        shutdown_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process queued analysis jobs")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "4")), help="jobs processed in parallel")
+    parser.add_argument("--poll-interval", type=float, default=float(os.getenv("WORKER_POLL_INTERVAL", "1.0")), help="seconds to wait when the queue is empty")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is drained")
+    args = parser.parse_args()
+
+    init_db()
+    asyncio.run(main(args.concurrency, args.poll_interval, args.once))
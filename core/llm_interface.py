@@ -5,7 +5,8 @@ import requests
 import streamlit as st
 
 GROQ_API_KEY = st.secrets["GROQ_API_KEY"]
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com")
+GROQ_API_URL = f"{GROQ_BASE_URL.rstrip('/')}/openai/v1/chat/completions"
 GROQ_MODEL = "llama-3.1-70b-versatile"
 
 def extract_json_from_text(text: str) -> dict:
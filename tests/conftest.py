@@ -0,0 +1,53 @@
+"""Shared fixtures: one throwaway SQLite database for the test session, emptied between tests"""
+import os
+import tempfile
+
+# Must be set before app.db builds its engine
+_DB_DIR = tempfile.mkdtemp(prefix="perfume-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/test.db"
+os.environ["GROQ_API_KEY"] = ""
+
+import pytest
+from sqlalchemy import delete, event
+
+from app.db import Base, SessionLocal, engine, init_db
+from app.services import compound_cache
+
+
+def _empty(session) -> None:
+    for table in reversed(Base.metadata.sorted_tables):
+        if table.name != "app_meta":
+            session.execute(delete(table))
+    session.commit()
+
+
+@pytest.fixture(scope="session")
+def _schema():
+    init_db()
+    # Tests start from empty tables, not the seeded knowledge base
+    session = SessionLocal()
+    _empty(session)
+    session.close()
+
+
+@pytest.fixture
+def db(_schema):
+    session = SessionLocal()
+    yield session
+    session.rollback()
+    _empty(session)
+    session.close()
+    compound_cache.clear()
+
+
+@pytest.fixture
+def statements():
+    """SQL run through the sync engine while the test is active"""
+    seen: list[str] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    yield seen
+    event.remove(engine, "before_cursor_execute", _record)
@@ -0,0 +1,126 @@
+import threading
+
+from sqlalchemy import event, select
+
+from app import models
+from app.db import SessionLocal
+from app.services import compound_crud, ingredient_crud
+
+
+def _compound(db, *lines):
+    ingredients = [models.Ingredient(name=name) for name, _ in lines]
+    compound = models.Compound(name="Test")
+    db.add_all([compound, *ingredients])
+    db.flush()
+    compound_crud.add_items(db, compound.id, [(i.id, pct) for i, (_, pct) in zip(ingredients, lines)])
+    db.commit()
+    return compound.id, [i.id for i in ingredients]
+
+
+def _writes(statements):
+    return [s for s in statements if s.lstrip().split()[0].upper() in ("INSERT", "UPDATE", "DELETE")]
+
+
+def _formula(db, compound_id):
+    return [(item["ingredient_id"], item["percentage"]) for item in compound_crud.get_items(db, compound_id)]
+
+
+def test_sync_identical_formula_writes_nothing(db, statements):
+    compound_id, (a, b) = _compound(db, ("A", 10.0), ("B", 90.0))
+    statements.clear()
+    assert compound_crud.sync_items(db, compound_id, [(a, 10.0), (b, 90.0)]) is False
+    assert _writes(statements) == []
+
+
+def test_sync_changed_amount_is_one_update(db, statements):
+    compound_id, (a, b) = _compound(db, ("A", 10.0), ("B", 90.0))
+    statements.clear()
+    assert compound_crud.sync_items(db, compound_id, [(a, 20.0), (b, 90.0)]) is True
+    writes = _writes(statements)
+    assert len(writes) == 1 and writes[0].lstrip().upper().startswith("UPDATE")
+    assert _formula(db, compound_id) == [(a, 20.0), (b, 90.0)]
+
+
+def test_sync_adds_and_removes_lines(db):
+    compound_id, (a, b) = _compound(db, ("A", 10.0), ("B", 90.0))
+    c = models.Ingredient(name="C")
+    db.add(c)
+    db.flush()
+    assert compound_crud.sync_items(db, compound_id, [(b, 90.0), (c.id, 10.0)]) is True
+    assert sorted(_formula(db, compound_id)) == sorted([(b, 90.0), (c.id, 10.0)])
+
+
+def test_sync_keeps_repeated_ingredient_lines(db):
+    compound_id, (a,) = _compound(db, ("A", 10.0))
+    assert compound_crud.sync_items(db, compound_id, [(a, 10.0), (a, 5.0)]) is True
+    assert _formula(db, compound_id) == [(a, 10.0), (a, 5.0)]
+    assert compound_crud.sync_items(db, compound_id, [(a, 10.0)]) is True
+    assert _formula(db, compound_id) == [(a, 10.0)]
+
+
+def test_patch_sets_adds_and_removes(db):
+    compound_id, (a, b) = _compound(db, ("A", 10.0), ("B", 90.0))
+    c = models.Ingredient(name="C")
+    db.add(c)
+    db.flush()
+    assert compound_crud.patch_items(db, compound_id, [(a, 15.0), (c.id, 5.0)], [b]) is True
+    assert sorted(_formula(db, compound_id)) == sorted([(a, 15.0), (c.id, 5.0)])
+
+
+def test_patch_removing_absent_ingredient_writes_nothing(db, statements):
+    compound_id, (a, b) = _compound(db, ("A", 10.0), ("B", 90.0))
+    other = models.Ingredient(name="Other")
+    db.add(other)
+    db.commit()
+    statements.clear()
+    assert compound_crud.patch_items(db, compound_id, [(a, 10.0)], [other.id, 999_999]) is False
+    assert _writes(statements) == []
+    assert _formula(db, compound_id) == [(a, 10.0), (b, 90.0)]
+
+
+def test_resolve_by_id_and_name_creates_unknown_names(db):
+    known = models.Ingredient(name="Hedione")
+    db.add(known)
+    db.commit()
+    by_id, by_key = ingredient_crud.resolve_ingredients(db, [known.id, 999_999], ["  HEDIONE ", "New Note"])
+    db.commit()
+    assert by_id == {known.id: "Hedione"}
+    assert by_key["hedione"] == (known.id, "Hedione")
+    new_id, new_name = by_key["new note"]
+    assert new_name == "New Note" and db.get(models.Ingredient, new_id) is not None
+
+
+def test_concurrent_resolvers_create_one_row(db):
+    # Both sessions see the name missing, then race to insert it
+    barrier = threading.Barrier(2, timeout=10)
+    results, errors = [], []
+
+    def _hold_before_insert(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT") and "ingredients" in statement:
+            barrier.wait()
+
+    def _resolve():
+        session = SessionLocal()
+        try:
+            _, by_key = ingredient_crud.resolve_ingredients(session, [], ["Race Note"])
+            session.commit()
+            results.append(by_key["race note"])
+        except Exception as e:  # surfaced by the assertion below
+            errors.append(e)
+        finally:
+            session.close()
+
+    event.listen(db.get_bind(), "before_cursor_execute", _hold_before_insert)
+    try:
+        threads = [threading.Thread(target=_resolve) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", _hold_before_insert)
+
+    assert errors == []
+    assert len(results) == 2 and results[0] == results[1]
+    rows = db.execute(select(models.Ingredient.id).where(models.Ingredient.normalized_name == "race note")).all()
+    assert len(rows) == 1
@@ -0,0 +1,46 @@
+from sqlalchemy import text
+
+from app import models
+from app.services import compound_crud
+
+
+def _set_updated_at(db, compound_id, stored):
+    db.execute(text("UPDATE compounds SET updated_at = :stored WHERE id = :id"), {"stored": stored, "id": compound_id})
+
+
+def _walk(db, limit):
+    seen, after = [], None
+    while True:
+        page = compound_crud.get_all_compounds(db, limit=limit, after=after)
+        seen.extend(row["id"] for row in page)
+        if len(page) < limit:
+            return seen
+        after = (page[-1]["updated_at"], page[-1]["id"])
+
+
+def test_paging_walks_rows_tied_on_the_second(db):
+    compounds = [models.Compound(name=f"C{i}") for i in range(10)]
+    db.add_all(compounds)
+    db.commit()
+    ids = [c.id for c in compounds]
+    # Rows imported before timestamps were stored at whole seconds carry microseconds
+    for i, compound_id in enumerate(ids[:5]):
+        _set_updated_at(db, compound_id, f"2026-01-01 12:00:00.{i + 1}00000")
+    for compound_id in ids[5:]:
+        _set_updated_at(db, compound_id, "2026-01-01 12:00:00")
+    db.commit()
+
+    expected = sorted(ids, reverse=True)
+    for limit in (1, 2, 3, 10):
+        assert _walk(db, limit) == expected
+
+
+def test_paging_orders_by_second_then_id(db):
+    older, newer = models.Compound(name="old"), models.Compound(name="new")
+    db.add_all([older, newer])
+    db.commit()
+    _set_updated_at(db, older.id, "2026-01-01 12:00:00.900000")
+    _set_updated_at(db, newer.id, "2026-01-01 12:00:01")
+    db.commit()
+
+    assert _walk(db, 1) == [newer.id, older.id]
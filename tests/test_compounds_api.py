@@ -0,0 +1,150 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, select
+
+from app import models
+from app.db import get_async_engine
+from app.main import app
+from app.services import compound_cache, compound_crud
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def api_writes():
+    """INSERT/UPDATE/DELETE statements the API runs while the test is active"""
+    seen: list[str] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split()[0].upper() in ("INSERT", "UPDATE", "DELETE"):
+            seen.append(statement)
+
+    sync_engine = get_async_engine().sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _record)
+    yield seen
+    event.remove(sync_engine, "before_cursor_execute", _record)
+
+
+def _create(client, items):
+    response = client.post("/compounds", json={"name": "Test", "description": "d", "items": items})
+    assert response.status_code == 200
+    return response.json()
+
+
+def _updated_at(db, compound_id):
+    db.expire_all()
+    return db.execute(select(models.Compound.updated_at).where(models.Compound.id == compound_id)).scalar()
+
+
+def test_identical_put_writes_nothing(client, db, api_writes):
+    created = _create(client, [{"ingredient_name": "Api A", "percentage": 10}, {"ingredient_name": "Api B", "percentage": 90}])
+    before = _updated_at(db, created["id"])
+    api_writes.clear()
+
+    items = [{"ingredient_id": i["ingredient_id"], "percentage": i["percentage"]} for i in created["items"]]
+    response = client.put(f"/compounds/{created['id']}", json={"name": "Test", "description": "d", "items": items})
+    assert response.status_code == 200
+    assert api_writes == []
+    assert _updated_at(db, created["id"]) == before
+
+
+def test_put_changed_amount_is_one_line_update(client, db, api_writes):
+    created = _create(client, [{"ingredient_name": "Api A", "percentage": 10}, {"ingredient_name": "Api B", "percentage": 90}])
+    api_writes.clear()
+
+    items = [{"ingredient_name": "api a", "percentage": 20}, {"ingredient_name": "Api B", "percentage": 90}]
+    response = client.put(f"/compounds/{created['id']}", json={"name": "Test", "description": "d", "items": items})
+    assert response.status_code == 200
+    line_updates = [s for s in api_writes if "compound_ingredients" in s]
+    assert len(line_updates) == 1 and line_updates[0].lstrip().upper().startswith("UPDATE")
+    assert [i["percentage"] for i in response.json()["items"]] == [20, 90]
+
+
+def test_put_adds_by_name_and_removes_by_omission(client):
+    created = _create(client, [{"ingredient_name": "Api A", "percentage": 10}, {"ingredient_name": "Api B", "percentage": 90}])
+    b_id = created["items"][1]["ingredient_id"]
+    items = [{"ingredient_id": b_id, "percentage": 80}, {"ingredient_name": "Api C", "percentage": 20}]
+    response = client.put(f"/compounds/{created['id']}", json={"name": "Test", "description": "d", "items": items})
+    assert response.status_code == 200
+    assert [(i["ingredient_name"], i["percentage"]) for i in client.get(f"/compounds/{created['id']}").json()["items"]] == [
+        ("Api B", 80),
+        ("Api C", 20),
+    ]
+
+
+def test_put_unknown_ingredient_id_is_404(client):
+    created = _create(client, [{"ingredient_name": "Api A", "percentage": 10}])
+    response = client.put(
+        f"/compounds/{created['id']}", json={"name": "Test", "items": [{"ingredient_id": 999_999, "percentage": 10}]}
+    )
+    assert response.status_code == 404
+
+
+def test_patch_adds_by_id_or_name_and_removes(client):
+    created = _create(client, [{"ingredient_name": "Api A", "percentage": 10}, {"ingredient_name": "Api B", "percentage": 90}])
+    a_id, b_id = (i["ingredient_id"] for i in created["items"])
+    extra = _create(client, [{"ingredient_name": "Api D", "percentage": 1}])["items"][0]["ingredient_id"]
+    response = client.patch(
+        f"/compounds/{created['id']}/items",
+        json={
+            "upsert": [{"ingredient_id": extra, "percentage": 5}, {"ingredient_name": "Api C", "percentage": 5}],
+            "remove": [a_id],
+        },
+    )
+    assert response.status_code == 200
+    assert [(i["ingredient_name"], i["percentage"]) for i in response.json()["items"]] == [("Api B", 90), ("Api D", 5), ("Api C", 5)]
+    assert b_id in [i["ingredient_id"] for i in response.json()["items"]]
+
+
+def test_patch_removing_ingredient_not_in_formula_writes_nothing(client, db, api_writes):
+    created = _create(client, [{"ingredient_name": "Api A", "percentage": 10}])
+    other = _create(client, [{"ingredient_name": "Api Z", "percentage": 1}])["items"][0]["ingredient_id"]
+    before = _updated_at(db, created["id"])
+    api_writes.clear()
+
+    response = client.patch(f"/compounds/{created['id']}/items", json={"remove": [other]})
+    assert response.status_code == 200
+    assert [i["ingredient_name"] for i in response.json()["items"]] == ["Api A"]
+    assert api_writes == []
+    assert _updated_at(db, created["id"]) == before
+
+
+def _cached_etag(client, compound_id):
+    response = client.get(f"/compounds/{compound_id}")
+    assert response.status_code == 200
+    assert compound_cache.get(compound_id) is not None
+    return response.headers["etag"]
+
+
+def test_put_invalidates_cached_compound(client):
+    created = _create(client, [{"ingredient_name": "Api A", "percentage": 10}])
+    etag = _cached_etag(client, created["id"])
+    assert client.get(f"/compounds/{created['id']}", headers={"If-None-Match": etag}).status_code == 304
+
+    client.put(f"/compounds/{created['id']}", json={"name": "Renamed", "items": [{"ingredient_name": "Api A", "percentage": 10}]})
+    response = client.get(f"/compounds/{created['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Renamed"
+
+
+def test_patch_invalidates_cached_compound(client):
+    created = _create(client, [{"ingredient_name": "Api A", "percentage": 10}])
+    etag = _cached_etag(client, created["id"])
+
+    client.patch(f"/compounds/{created['id']}/items", json={"upsert": [{"ingredient_name": "Api A", "percentage": 30}]})
+    response = client.get(f"/compounds/{created['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["items"][0]["percentage"] == 30
+
+
+def test_delete_invalidates_cached_compound(client, db):
+    created = _create(client, [{"ingredient_name": "Api A", "percentage": 10}])
+    _cached_etag(client, created["id"])
+
+    compound_crud.delete_compound(db, created["id"])
+    assert compound_cache.get(created["id"]) is None
+    assert client.get(f"/compounds/{created['id']}").status_code == 404
@@ -0,0 +1,61 @@
+from sqlalchemy import select, text
+
+from app import models
+from app.services import ingredient_crud
+
+
+def _row(name, **values):
+    row = {col: None for col in ingredient_crud._UPDATABLE}
+    row.update(values, name=name, normalized_name=models.normalize_name(name))
+    return row
+
+
+def _total_changes(db) -> int:
+    # Rows written on this connection, including FTS trigger writes
+    return db.execute(text("SELECT total_changes()")).scalar()
+
+
+def test_upsert_counts_inserted_then_changed_rows(db):
+    rows = [_row("Iso E Super", tags="woody"), _row("Hedione", tags="floral")]
+    ids, inserted, updated = ingredient_crud.upsert_rows(db, rows)
+    db.commit()
+    assert (inserted, updated) == (2, 0)
+    assert set(ids) == {"iso e super", "hedione"}
+
+    _, inserted, updated = ingredient_crud.upsert_rows(db, [_row("Iso E Super", tags="woody,amber"), _row("Hedione", tags="floral")])
+    db.commit()
+    assert (inserted, updated) == (0, 1)
+    assert db.execute(select(models.Ingredient.tags).where(models.Ingredient.name == "Iso E Super")).scalar() == "woody,amber"
+
+
+def test_unchanged_upsert_writes_nothing(db):
+    rows = [_row("Iso E Super", tags="woody", cas_number="54464-57-2"), _row("Hedione")]
+    ingredient_crud.upsert_rows(db, rows)
+    db.commit()
+
+    # Both readings in one transaction, so on the same connection
+    before = _total_changes(db)
+    # Empty fields never overwrite, so a row carrying less than what is stored is unchanged too
+    ids, inserted, updated = ingredient_crud.upsert_rows(db, rows + [_row("Iso E Super", tags="woody")])
+    assert _total_changes(db) == before
+    db.commit()
+    assert (inserted, updated) == (0, 0)
+    assert set(ids) == {"iso e super", "hedione"}
+
+
+def test_seed_resync_reports_only_changed_ingredients(db, tmp_path, capsys):
+    from app import db as app_db
+
+    seed = tmp_path / "seed.json"
+    seed.write_text('[{"name": "Ambroxan", "family": ["amber"]}, {"name": "Linalool", "family": ["floral"]}]')
+    app_db._sync_ingredient_seed(str(seed))
+    assert "2 ingredients added, 0 updated" in capsys.readouterr().out
+
+    # Same content under a new hash: nothing to write or report
+    seed.write_text('[{"name": "Ambroxan", "family": ["amber"]}, {"name": "Linalool", "family": ["floral"]} ]')
+    app_db._sync_ingredient_seed(str(seed))
+    assert "Synced" not in capsys.readouterr().out
+
+    seed.write_text('[{"name": "Ambroxan", "family": ["amber", "woody"]}, {"name": "Linalool", "family": ["floral"]}]')
+    app_db._sync_ingredient_seed(str(seed))
+    assert "0 ingredients added, 1 updated" in capsys.readouterr().out
@@ -0,0 +1,46 @@
+from app import models
+from app.services import ingredient_search
+
+
+def _add(db, name, tags=None, aliases=None, cas_number=None):
+    db.add(models.Ingredient(name=name, tags=tags, aliases=aliases, cas_number=cas_number))
+    db.commit()
+
+
+def _names(db, query):
+    return [hit["name"] for hit in ingredient_search.search_ingredients(db, query)]
+
+
+def test_partial_tag_finds_tagged_ingredients(db):
+    _add(db, "Iso E Super", tags="woody,amber")
+    _add(db, "Cedarwood Atlas", tags="woody,dry")
+    _add(db, "Hedione", tags="floral,fresh")
+    assert set(_names(db, "woo")) == {"Iso E Super", "Cedarwood Atlas"}
+    assert _names(db, "wood")[0] == "Cedarwood Atlas"  # name word beats tag
+
+
+def test_partial_alias_word_matches(db):
+    _add(db, "Methyl dihydrojasmonate", aliases="Hedione,MDJ")
+    _add(db, "Linalool", tags="floral")
+    assert _names(db, "hedi") == ["Methyl dihydrojasmonate"]
+
+
+def test_name_prefix_outranks_tag_prefix(db):
+    _add(db, "Ambroxan", tags="amber,woody")
+    _add(db, "Amberwood", tags="amber")
+    _add(db, "Labdanum", tags="amber,resinous")
+    hits = ingredient_search.search_ingredients(db, "amb")
+    assert {hit["name"] for hit in hits} == {"Ambroxan", "Amberwood", "Labdanum"}
+    assert hits[-1]["name"] == "Labdanum"
+
+
+def test_exact_tag_and_cas(db):
+    _add(db, "Galaxolide", tags="white floral,musk", cas_number="1222-05-5")
+    _add(db, "Hedione", tags="floral")
+    assert _names(db, "white floral") == ["Galaxolide"]
+    assert _names(db, "1222-05-5") == ["Galaxolide"]
+
+
+def test_unrelated_trigram_overlap_is_dropped(db):
+    _add(db, "Iso E Super", tags="woody")
+    assert _names(db, "xyzwoo") == []
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta, timezone
+
+from app import models
+from app.services import jobs
+
+
+def _lapse(db, job_id: int) -> None:
+    job = db.get(models.AnalysisJob, job_id)
+    job.locked_until = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+
+
+def test_lapsed_job_is_reclaimed_while_attempts_remain(db):
+    compound = models.Compound(name="C")
+    db.add(compound)
+    db.commit()
+    job = jobs.enqueue_analysis(db, compound.id)
+
+    assert jobs.claim_job(db, "w1").attempts == 1
+    assert jobs.claim_job(db, "w2") is None  # still leased
+    _lapse(db, job.id)
+    reclaimed = jobs.claim_job(db, "w2")
+    assert reclaimed.id == job.id and reclaimed.attempts == 2 and reclaimed.locked_by == "w2"
+
+
+def test_lapsed_job_without_attempts_left_fails(db):
+    compound = models.Compound(name="C")
+    db.add(compound)
+    db.commit()
+    job = jobs.enqueue_analysis(db, compound.id)
+
+    for _ in range(job.max_attempts):
+        assert jobs.claim_job(db, "w").id == job.id
+        _lapse(db, job.id)
+    assert jobs.claim_job(db, "w") is None
+    db.expire_all()
+    failed = db.get(models.AnalysisJob, job.id)
+    assert failed.status == "failed"
+    assert failed.attempts == failed.max_attempts
+    assert "Lease expired" in failed.error
+    assert failed.locked_by is None
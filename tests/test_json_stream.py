@@ -0,0 +1,64 @@
+from app.services.json_stream import TopLevelFieldParser, repair_json
+
+
+def _feed_all(chunks):
+    parser = TopLevelFieldParser()
+    fields = []
+    for chunk in chunks:
+        fields.extend(parser.feed(chunk))
+    return parser, fields
+
+
+def test_repair_strips_code_fence_and_prose():
+    text = 'Here you go:\n```json\n{"a": 1, "b": [1, 2]}\n```\nHope that helps'
+    assert repair_json(text) == {"a": 1, "b": [1, 2]}
+
+
+def test_repair_drops_trailing_commas():
+    assert repair_json('{"a": [1, 2,], "b": {"c": 3,},}') == {"a": [1, 2], "b": {"c": 3}}
+
+
+def test_repair_closes_truncated_string_and_brackets():
+    assert repair_json('{"a": 1, "b": ["x", "y') == {"a": 1, "b": ["x", "y"]}
+
+
+def test_repair_drops_incomplete_trailing_member():
+    assert repair_json('{"a": 1, "b":') == {"a": 1, "b": None}
+    assert repair_json('{"a": {"x": [1, {"y": 2}]}, "b": tr') == {"a": {"x": [1, {"y": 2}]}}
+
+
+def test_repair_ignores_brackets_and_escaped_quotes_inside_strings():
+    assert repair_json(r'{"a": "} ] \" {", "b": 2}') == {"a": '} ] " {', "b": 2}
+
+
+def test_repair_gives_up_without_an_object():
+    assert repair_json("no json here") is None
+
+
+def test_parser_emits_fields_as_they_close():
+    parser = TopLevelFieldParser()
+    assert parser.feed('{"a": 1, "b": ') == [("a", 1)]
+    assert parser.feed('{"c": [1, 2]}, ') == [("b", {"c": [1, 2]})]
+    assert parser.feed('"d": "x"}') == [("d", "x")]
+    assert parser.done
+
+
+def test_parser_handles_every_chunk_boundary():
+    text = 'preamble {"a": "say \\"hi\\" {[", "b": [{"c": "]}"}], "d": null} trailing'
+    expected = [("a", 'say "hi" {['), ("b", [{"c": "]}"}]), ("d", None)]
+    for cut in range(len(text) + 1):
+        parser, fields = _feed_all([text[:cut], text[cut:]])
+        assert fields == expected, cut
+        assert parser.done
+    _, fields = _feed_all(list(text))
+    assert fields == expected
+
+
+def test_parser_escaped_backslash_before_closing_quote():
+    _, fields = _feed_all(['{"a": "x\\', '\\", "b": 1}'])
+    assert fields == [("a", "x\\"), ("b", 1)]
+
+
+def test_parser_skips_undecodable_values():
+    _, fields = _feed_all(['{"a": nope, "b": 2}'])
+    assert fields == [("b", 2)]
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from sqlalchemy import select, text
+
+from app import models
+from app.db import SessionLocal
+from app.services import compound_crud, library_io
+
+
+def _library(db, compounds=3):
+    ingredients = [models.Ingredient(name=f"Lib {n}", tags="woody") for n in "ABC"]
+    db.add_all(ingredients)
+    db.flush()
+    for n in range(compounds):
+        compound = models.Compound(name=f"Compound {n}", created_at=datetime(2026, 1, 1, 12, 0, 0, 1000 * n))
+        db.add(compound)
+        db.flush()
+        compound_crud.add_items(db, compound.id, [(ingredient.id, 10.0 + n) for ingredient in ingredients])
+    db.commit()
+
+
+def _export(db):
+    records = list(library_io.iter_export(db))
+    db.rollback()
+    return records
+
+
+def test_reimporting_an_unchanged_export_changes_nothing(db):
+    _library(db)
+    records = _export(db)
+    stats = library_io.import_records(db, records)
+    assert stats["ingredients_inserted"] == stats["ingredients_updated"] == 0
+    assert stats["compounds_inserted"] == stats["compounds_updated"] == 0
+    assert stats["compounds_unchanged"] == 3
+
+
+def test_imported_compounds_store_whole_seconds_and_page_fully(db):
+    _library(db, compounds=10)
+    records = [dict(r, updated_at="2026-02-01T08:00:00.123456") if r["type"] == "compound" else r for r in _export(db)]
+    for table in ("compound_ingredients", "compounds"):
+        db.execute(text(f"DELETE FROM {table}"))
+    db.commit()
+
+    assert library_io.import_records(db, records)["compounds_inserted"] == 10
+    stored = db.execute(text("SELECT created_at, updated_at FROM compounds")).all()
+    assert all("." not in created and "." not in updated for created, updated in stored)
+
+    seen, after = [], None
+    while page := compound_crud.get_all_compounds(db, limit=2, after=after):
+        seen.extend(row["id"] for row in page)
+        after = (page[-1]["updated_at"], page[-1]["id"])
+    assert seen == sorted(db.execute(select(models.Compound.id)).scalars(), reverse=True)
+
+    # Matched again on (name, creation second) rather than duplicated
+    assert library_io.import_records(db, records)["compounds_unchanged"] == 10
+
+
+def test_export_pages_read_one_snapshot(db):
+    _library(db, compounds=2)
+    reader = SessionLocal()
+    try:
+        library_io.begin_snapshot(reader)
+        first, cursor = library_io.export_page(reader, "compound", None, 1)
+
+        db.add(models.Compound(name="Added during export"))
+        db.commit()
+
+        rest, _ = library_io.export_page(reader, "compound", cursor, 10)
+        assert [r["name"] for r in first + rest] == ["Compound 0", "Compound 1"]
+    finally:
+        reader.close()
@@ -0,0 +1,88 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from groq import BadRequestError
+
+from app.services import analysis
+
+SCHEMA = {"type": "object", "required": ["summary"]}
+VALID = json.dumps({"summary": "ok"})
+
+
+def _response(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def _bad_request(failed_generation=None):
+    body = {"error": {"message": "bad", "failed_generation": failed_generation}}
+    request = httpx.Request("POST", "https://example.invalid")
+    return BadRequestError("bad", response=httpx.Response(400, request=request), body=body)
+
+
+class _Completions:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return _response(outcome)
+
+
+class _AsyncCompletions(_Completions):
+    async def create(self, **kwargs):
+        return super().create(**kwargs)
+
+
+def _run(monkeypatch, outcomes, asynchronous, json_mode=True):
+    monkeypatch.setattr(analysis.settings, "analysis_json_mode", json_mode)
+    completions = (_AsyncCompletions if asynchronous else _Completions)(outcomes)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    if asynchronous:
+        monkeypatch.setattr(analysis, "get_async_groq_client", lambda: client)
+        result = asyncio.run(analysis.call_llm_with_retries("prompt", SCHEMA))
+    else:
+        monkeypatch.setattr(analysis, "get_groq_client", lambda: client)
+        result = analysis.call_llm_with_retries_sync("prompt", SCHEMA)
+    return result, completions.calls
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_invalid_output_is_sent_back_for_repair(monkeypatch, asynchronous):
+    result, calls = _run(monkeypatch, ['{"other": 1}', VALID], asynchronous)
+    assert result == {"summary": "ok"}
+    assert len(calls) == 2
+    assert calls[1]["messages"][0]["content"] == analysis.REPAIR_SYSTEM_PROMPT
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_failed_generation_is_repaired_locally(monkeypatch, asynchronous):
+    result, calls = _run(monkeypatch, [_bad_request('```json\n{"summary": "ok",}\n```')], asynchronous)
+    assert result == {"summary": "ok"}
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_json_mode_rejection_falls_back_to_plain_text(monkeypatch, asynchronous):
+    result, calls = _run(monkeypatch, [_bad_request(), VALID], asynchronous)
+    assert result == {"summary": "ok"}
+    assert "response_format" in calls[0] and "response_format" not in calls[1]
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_bad_request_without_json_mode_propagates(monkeypatch, asynchronous):
+    with pytest.raises(BadRequestError):
+        _run(monkeypatch, [_bad_request()], asynchronous, json_mode=False)
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_fallback_after_retries_exhausted(monkeypatch, asynchronous):
+    result, calls = _run(monkeypatch, ["", "", ""], asynchronous)
+    assert result == analysis.FALLBACK_RESULT
+    assert len(calls) == 3